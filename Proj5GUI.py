@@ -27,6 +27,7 @@ else:
 from TSPSolver import *
 #from TSPSolver_complete import *
 from TSPClasses import *
+from TSPCache import ResultCache
 
 
 class PointLineView( QWidget ):
@@ -41,12 +42,15 @@ class PointLineView( QWidget ):
 		self.data_range = data_range
 		self.start_pt = None
 		self.end_pt = None
+		self._picture = None
+		self._picture_size = None
 
 	def displayStatusText(self, text):
 		self.status_bar.showMessage(text)
 
 	def clearPoints(self):
 		self.pointList = {}
+		self.invalidate()
 
 	def clearEdges(self,removeColors = None):
 		self.edgeList = {}
@@ -56,13 +60,15 @@ class PointLineView( QWidget ):
 					del self.labelList[color]			
 		else:
 			self.labelList = {}
-		self.repaint()
+		self.invalidate()
+		self.update()
 
 	def addPoints( self, point_list, color ):
 		if color in self.pointList:
 			self.pointList[color].extend( point_list )
 		else:
 			self.pointList[color] = point_list
+		self.invalidate()
 
 #	def setStartLoc( self, point ):
 #		self.start_pt = point
@@ -86,6 +92,7 @@ class PointLineView( QWidget ):
 			self.edgeList[edgeColor].append( edge )
 		else:
 			self.edgeList[edgeColor] = [edge]
+		self.invalidate()
 
 		midp = QPointF( (edge.x1()*0.2 + edge.x2()*0.8), 
 						(edge.y1()*0.2 + edge.y2()*0.8) )
@@ -96,18 +103,47 @@ class PointLineView( QWidget ):
 			self.labelList[labelColor].append( (point,label,xoffset) )
 		else:
 			self.labelList[labelColor] = [(point,label,xoffset)]
+		self.invalidate()
 
 
 
 
 	def paintEvent(self, event):
+		# Replay the cached scene; it is only re-recorded after the tour, points or
+		# labels change (see invalidate) or the window is resized.
+		size = (self.width(), self.height())
+		if self._picture is None or self._picture_size != size:
+			self._picture = QPicture()
+			recorder = QPainter(self._picture)
+			recorder.setRenderHint(QPainter.Antialiasing,True)
+			self.drawScene(recorder)
+			recorder.end()
+			self._picture_size = size
 		painter = QPainter(self)
-		painter.setRenderHint(QPainter.Antialiasing,True)
+		painter.drawPicture(0, 0, self._picture)
 
+	def resizeEvent(self, event):
+		self.invalidate()
+		super(PointLineView,self).resizeEvent(event)
+
+	def invalidate(self):
+		self._picture = None
+
+	# Level of detail: arrowheads are dropped when there are too many edges or an
+	# edge is too short on screen to show one, and labels are thinned out so that
+	# each one gets at least LABEL_AREA square pixels of the window.
+	ARROW_EDGE_LIMIT = 1000
+	ARROW_MIN_PIXELS = 15.0
+	LABEL_LIMIT		 = 500
+	LABEL_AREA		 = 2500.0
+
+	def drawScene(self, painter):
 		xr = self.data_range['x']
 		yr = self.data_range['y']
 		w = self.width()
 		h = self.height()
+		if w <= 0 or h <= 0:
+			return
 		w2h_desired_ratio = (xr[1]-xr[0])/(yr[1]-yr[0])
 		if w / h < w2h_desired_ratio:
 			 scale = w / (xr[1]-xr[0])
@@ -119,76 +155,98 @@ class PointLineView( QWidget ):
 		tform.scale(1.0,-1.0)
 		painter.setTransform(tform)
 
+		# One path of lines and one path of arrowheads per color
+		nedges = sum( len(edges) for edges in self.edgeList.values() )
+		draw_arrows = nedges <= self.ARROW_EDGE_LIMIT
+		arrow_scale = 5.0
 		for color in self.edgeList:
 			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
-			for edge in self.edgeList[color]:
-				ln = QLineF( scale*edge.x1(), scale*edge.y1(), scale*edge.x2(), scale*edge.y2() )
-				painter.drawLine( ln )
-
-		for color in self.edgeList:
-			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
+			lines = QPainterPath()
+			arrows = QPainterPath()
 			for edge in self.edgeList[color]:
-				#arrow_scale = .015
-				arrow_scale = 5.0
-				unit_edge = ( edge.x2() - edge.x1(), edge.y2() - edge.y1() )
-				unit_edge_mag = math.sqrt( ( edge.x2() - edge.x1())**2 + ( edge.y2() - edge.y1() )**2 )
-				unit_edge = (unit_edge[0] / unit_edge_mag, unit_edge[1] / unit_edge_mag )
+				x1, y1 = scale*edge.x1(), scale*edge.y1()
+				x2, y2 = scale*edge.x2(), scale*edge.y2()
+				lines.moveTo( x1, y1 )
+				lines.lineTo( x2, y2 )
+
+				unit_edge_mag = math.sqrt( (x2 - x1)**2 + (y2 - y1)**2 )
+				if not draw_arrows or unit_edge_mag < self.ARROW_MIN_PIXELS:
+					continue
+				unit_edge = ( (x2 - x1) / unit_edge_mag, (y2 - y1) / unit_edge_mag )
 				unit_edge_perp = (-unit_edge[1], unit_edge[0])
-
-				temp_tform = QTransform()
-				temp_tform.translate(self.width()/2.0,self.height()/2.0)
-				temp_tform.scale(1.0,-1.0)
-				temp_tform.translate(scale*edge.x2(),scale*edge.y2())
-				temp_tform.scale(1.0,-1.0)
-				painter.setTransform(temp_tform)
-				#painter.drawText( RECT, label[1], align )
-
-				tri_pts = []
-				tri_pts.append( QPointF(0,0) )
-				tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] + unit_edge_perp[0]),
-										arrow_scale*(2*unit_edge[1] + unit_edge_perp[1])) )
-				tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] - unit_edge_perp[0]),
-										arrow_scale*(2*unit_edge[1] - unit_edge_perp[1])) )
-				tri = QPolygonF( tri_pts )
-				b = painter.brush()
+				# same triangle as before, expressed directly in the flipped frame
+				arrows.addPolygon( QPolygonF( [
+					QPointF(x2, y2),
+					QPointF(x2 - arrow_scale*(2*unit_edge[0] + unit_edge_perp[0]),
+							y2 - arrow_scale*(2*unit_edge[1] + unit_edge_perp[1])),
+					QPointF(x2 - arrow_scale*(2*unit_edge[0] - unit_edge_perp[0]),
+							y2 - arrow_scale*(2*unit_edge[1] - unit_edge_perp[1])) ] ) )
+				arrows.closeSubpath()
+			painter.setPen( c )
+			painter.setBrush( Qt.NoBrush )
+			painter.drawPath( lines )
+			if not arrows.isEmpty():
 				painter.setBrush( c )
-				painter.drawPolygon( tri )
-				painter.setBrush( b )
+				painter.drawPath( arrows )
 
-		painter.setTransform(tform)
+		# Labels are drawn upright, so place them in window coordinates
+		painter.setTransform(QTransform())
 		font = QFont("Monospace")
 		font.setStyleHint(QFont.TypeWriter)
 
 		R = 1.0E3
 		CITY_SIZE = 2.0 # DIAMETER
-		RECT = QRectF(-R,-R,2.0*R,2.0*R)
 		align = QTextOption( Qt.Alignment(Qt.AlignHCenter | Qt.AlignVCenter) )
+		nlabels = sum( len(labels) for labels in self.labelList.values() )
+		max_labels = min( self.LABEL_LIMIT, int(w*h / self.LABEL_AREA) )
+		stride = max( 1, int(math.ceil(nlabels / max(1, max_labels))) )
 		for color in self.labelList:
 			c = QColor(color[0],color[1],color[2])
 			painter.setPen( c )
-			for label in self.labelList[color]:
-				temp_tform = QTransform()
-				temp_tform.translate(self.width()/2.0,self.height()/2.0)
-				temp_tform.scale(1.0,-1.0)
+			for label in self.labelList[color][::stride]:
 				pt = label[0]
 				xoff = label[2]
-				temp_tform.translate(scale*pt.x()+xoff,scale*pt.y())
-				temp_tform.scale(1.0,-1.0)
-				painter.setTransform(temp_tform)
-				painter.drawText( RECT, label[1], align )
+				cx = w/2.0 + scale*pt.x() + xoff
+				cy = h/2.0 - scale*pt.y()
+				painter.drawText( QRectF(cx-R,cy-R,2.0*R,2.0*R), label[1], align )
 
 		painter.setTransform(tform)
 		for color in self.pointList:
 			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
-			b = painter.brush()
-			painter.setBrush(c)
+			dots = QPainterPath()
 			for point in self.pointList[color]:
-				pt = QPointF(scale*point.x(), scale*point.y())
-				painter.drawEllipse( pt, CITY_SIZE, CITY_SIZE)
-			painter.setBrush(b)
+				dots.addEllipse( QPointF(scale*point.x(), scale*point.y()), CITY_SIZE, CITY_SIZE )
+			painter.setPen( c )
+			painter.setBrush( c )
+			painter.drawPath( dots )
+		painter.setBrush( Qt.NoBrush )
+
+
+
+class SolverWorker( QThread ):
+	''' Runs one solve off the UI thread.  Every improved BSSF the solver reports
+		is sent back through the progress signal and the final results dictionary
+		through the solved signal; both are delivered on the GUI thread. '''
+	progress = pyqtSignal(object)
+	solved	 = pyqtSignal(object)
+
+	def __init__( self, solver, solve_func, time_allowance ):
+		super(SolverWorker,self).__init__()
+		self.solver = solver
+		self.solve_func = solve_func
+		self.time_allowance = time_allowance
+
+	def run( self ):
+		results = None
+		self.solver.setProgressCallback( self.progress.emit )
+		try:
+			results = self.solve_func( time_allowance=self.time_allowance )
+		finally:
+			self.solver.setProgressCallback( None )
+			self.solved.emit( results )
+
+	def cancel( self ):
+		self.solver.cancel()
 
 
 
@@ -202,8 +260,10 @@ class Proj5GUI( QMainWindow ):
 		self._MAX_SEED = 1000 
 
 		self._scenario = None
+		self._worker = None
 		self.initUI()
 		self.solver = TSPSolver( self.view )
+		self.solver.setResultCache( ResultCache() )		# repeated Solve clicks reuse earlier results
 		self.genParams = {'size':None,'seed':None,'diff':None}
 
 
@@ -264,7 +324,7 @@ class Proj5GUI( QMainWindow ):
 		self.view.repaint()
 
 
-	def displaySolution( self ) :						# what about calling this somehow every time a new bssf is found?
+	def displaySolution( self ) :						# also called (via SolverWorker.progress) every time a new bssf is found
 		self.view.clearEdges([(64,64,255)])				# get rid of edge labels but not point labels
 		if self._solution:
 			self.addCities()
@@ -279,7 +339,7 @@ class Proj5GUI( QMainWindow ):
 									   '{}'.format(label), edgeColor, labelColor )
 		else:
 			self.statusBar.showMessage('No Solution Found.')
-		self.view.repaint()
+		self.view.update()								# one paint per update: Qt merges it with clearEdges'
 
 
 	def randSeedClicked(self):
@@ -287,11 +347,12 @@ class Proj5GUI( QMainWindow ):
 		self.curSeed.setText( '{}'.format(new_seed) )
 		self.view.repaint()
 
-	def solveClicked(self):								# need to reset display??? and say "processing..." at bottom???
+	def solveClicked(self):
+		if self._worker:
+			return
 		self.solver.setupWithScenario(self._scenario)
 
 		max_time = float( self.timeLimit.text() )
-		# TODO - start on a separate thread
 		self.view.clearEdges([(64,64,255)])				# get rid of edge labels but not point labels
 		self.numSolutions.setText( '--' )
 		self.tourCost.setText( '--' )
@@ -300,10 +361,36 @@ class Proj5GUI( QMainWindow ):
 		self.totalStates.setText( '--' )
 		self.prunedStates.setText( '--' )
 		self.statusBar.showMessage('Processing...')
-		#self.view.repaint()
-		#app.processEvents()
+		self.solveButton.setEnabled(False)
+		self.generateButton.setEnabled(False)
+		self.cancelButton.setEnabled(True)
 		solve_func = 'self.solver.'+self.ALGORITHMS[self.algDropDown.currentIndex()][1]
-		results = eval(solve_func)(time_allowance=max_time )
+		self._worker = SolverWorker( self.solver, eval(solve_func), max_time )
+		self._worker.progress.connect(self.solutionImproved)
+		self._worker.solved.connect(self.solveFinished)
+		self._worker.start()
+
+	def cancelClicked(self):
+		if self._worker:
+			self.statusBar.showMessage('Cancelling...')
+			self.cancelButton.setEnabled(False)
+			self._worker.cancel()
+
+	def solutionImproved(self, update):
+		self.numSolutions.setText( '{}'.format(update['count']) )
+		self.tourCost.setText( '{}'.format(update['cost']) )
+		self.solvedIn.setText( '{:6.6f} seconds'.format(update['time']) )
+		self._solution = update['soln']
+		self.displaySolution()
+		if self._worker and self.cancelButton.isEnabled():
+			self.statusBar.showMessage('Processing... (best so far: {})'.format(update['cost']))
+
+	def solveFinished(self, results):
+		self._worker.wait()
+		self._worker = None
+		self.cancelButton.setEnabled(False)
+		self.solveButton.setEnabled(True)
+		self.checkGenInputs()
 		if results:
 			self.statusBar.showMessage('')
 			self.numSolutions.setText( '{}'.format(results['count']) )
@@ -319,15 +406,17 @@ class Proj5GUI( QMainWindow ):
 			#if self._solution:
 			self.displaySolution()
 		else:
+			self.statusBar.showMessage('')
 			print( 'GOT NULL SOLUTION BACK!!' )		#probably shouldn't ever use this...
-		self.view.repaint()
-#		app.processEvents()
+		self.view.update()
 
 	def checkGenInputs(self):
 		seed  = self.curSeed.text()
 		size = self.size.text()
 		diff = self.diffDropDown.currentText()
 
+		if self._worker:								# leave the buttons alone while a solve is running
+			return
 		if self._scenario:
 			if self.genParams['seed'] == seed and \
 			   self.genParams['size'] == size and \
@@ -369,8 +458,20 @@ class Proj5GUI( QMainWindow ):
 	ALGORITHMS = [ \
 		('Default                            ','defaultRandomTour'), \
 		('Greedy','greedy'), \
+		('Feasible Tour (backtracking)','feasibleTour'), \
+		('Nearest Insertion','nearestInsertion'), \
+		('Farthest Insertion','farthestInsertion'), \
+		('Cheapest Insertion','cheapestInsertion'), \
 		('Branch and Bound','branchAndBound'), \
-		('Fancy','fancy') \
+		('Fancy','fancy'), \
+		('Multi-start 2-opt (parallel)','multiStart'), \
+		('Simulated Annealing','simulatedAnnealing'), \
+		('Iterated Local Search','iteratedLocalSearch'), \
+		('Genetic Algorithm','geneticAlgorithm'), \
+		('Ant Colony (MAX-MIN)','antColony'), \
+		('Guided Local Search','guidedLocalSearch'), \
+		('Window DP Polish','windowPolish'), \
+		('Decomposition (parallel)','decomposition') \
 	]															# whitespace hack to get longest to display correctly
 
 	def initUI( self ):
@@ -394,6 +495,7 @@ class Proj5GUI( QMainWindow ):
 		self.randSeedButton = QPushButton('Randomize Seed')
 		self.generateButton = QPushButton('Generate Scenario')
 		self.solveButton	= QPushButton('Solve TSP')
+		self.cancelButton	= QPushButton('Cancel')
 
 		self.curSeed		= QLineEdit('20')
 		self.curSeed.setFixedWidth(100)
@@ -462,6 +564,7 @@ class Proj5GUI( QMainWindow ):
 		h.addWidget( self.timeLimit )
 		h.addWidget( QLabel( 'seconds' ) )
 		h.addWidget( self.solveButton )
+		h.addWidget( self.cancelButton )
 		h.addStretch(1)
 		vbox.addLayout(h)
 
@@ -481,6 +584,7 @@ class Proj5GUI( QMainWindow ):
 
 		self.lastPath = (None,None)
 		self.solveButton.setEnabled(False)
+		self.cancelButton.setEnabled(False)
 
 		self.curSeed.textChanged.connect(self.checkGenInputs)
 		self.size.textChanged.connect(self.checkGenInputs)
@@ -488,6 +592,7 @@ class Proj5GUI( QMainWindow ):
 		self.randSeedButton.clicked.connect(self.randSeedClicked)
 		self.generateButton.clicked.connect(self.generateClicked)
 		self.solveButton.clicked.connect(self.solveClicked)
+		self.cancelButton.clicked.connect(self.cancelClicked)
 
 		self.diffDropDown.addItem('Easy                               ')					# Weird hack to make box wide enough to show all of last item
 		self.diffDropDown.addItem('Normal')
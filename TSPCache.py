@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+''' <summary>
+	Disk cache for the arrays a Scenario spends its construction time on: the edge
+	mask and cost matrix of a dense scenario, or the removed-edge CSR arrays of a
+	sparse one.  Entries are directories of .npy files named by the scenario's
+	fingerprint and are opened with np.load(mmap_mode='r'), so a repeated run maps
+	them instead of thinning and costing again, and processes that open the same
+	entry share its pages through the OS page cache.  The directory is kept under
+	max_bytes by evicting the least recently used entries.
+	</summary>
+'''
+class CostCache:
+    DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'tsp-cost-cache')
+    DEFAULT_MAX_BYTES = 4 * 2**30
+
+    # Bump when the cached arrays would change for the same fingerprint inputs
+    FORMAT_VERSION = 1
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = self.DEFAULT_DIRECTORY if directory is None else directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    ''' <summary>
+		Fingerprint of everything that determines the scenario's edges and costs:
+		its coordinates and elevations, difficulty, storage mode and, for "Hard
+		(Deterministic)", the seed its removed edges are drawn from and the
+		fraction of edges removed (Scenario.HARD_MODE_FRACTION_TO_REMOVE).  Plain "Hard"
+		draws them from numpy's unseeded global state, so those scenarios cannot be
+		recognized before they are built and are never cached.
+		</summary>
+		<returns>hex digest, or None if the scenario cannot be cached</returns>
+	'''
+    def key(self, scenario, rand_seed=None):
+        difficulty = scenario._difficulty
+        if difficulty == 'Hard':
+            return None
+        if scenario.isSparse() and difficulty != 'Hard (Deterministic)':
+            return None  # nothing to store: no removed edges and the costs are lazy
+        digest = hashlib.sha256()
+        thinned = difficulty == 'Hard (Deterministic)'
+        digest.update(repr((self.FORMAT_VERSION, difficulty, scenario.isSparse(),
+                            rand_seed if thinned else None,
+                            scenario.HARD_MODE_FRACTION_TO_REMOVE if thinned else None)).encode())
+        digest.update(np.ascontiguousarray(np.column_stack(scenario.getCoordinates())).tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    # The entry's arrays called names, memory-mapped read-only, or None on a miss (including
+    # an entry missing any of them); a hit marks it recently used
+    def load(self, key, names):
+        path = self._path(key)
+        try:
+            arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in names}
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None  # missing, or evicted by another process while we were reading it
+        return arrays
+
+    ''' <summary>
+		Writes the arrays as a new entry and then evicts old entries down to
+		max_bytes.  The entry is assembled in a temporary directory and renamed
+		into place, so concurrent readers never see a partial entry; if another
+		process stored the same key first, its entry is kept unless replace is set.
+		</summary>
+	'''
+    def store(self, key, arrays, replace=False):
+        size = sum(np.asarray(array).nbytes for array in arrays.values())
+        if size > self.max_bytes:
+            return
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.staging-')
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, name + '.npy'), np.asarray(array))
+            if replace:
+                shutil.rmtree(self._path(key), ignore_errors=True)
+            os.replace(staging, self._path(key))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self.evict(keep=key)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, name))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    # Removes least recently used entries until the cache fits in max_bytes
+    # Time Complexity: O(e log e) for e entries
+    def evict(self, keep=None):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            # pages already mapped by other processes stay valid after the unlink
+            shutil.rmtree(self._path(name), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, name in self._entries():
+            shutil.rmtree(self._path(name), ignore_errors=True)
+
+
+''' <summary>
+	Memoizes solver results (see TSPSolver.setResultCache), keyed by the
+	scenario's fingerprint, the algorithm and its parameters other than the time
+	allowance.  Each entry keeps the best tour as an index array, the scalar
+	fields of the results dictionary, the time allowance it was found with, and
+	whether the solver finished before that allowance ran out.  The capacity most
+	recently used entries are kept in memory; with a directory, entries are also
+	written through to a CostCache there, so they survive the process and are
+	shared with other processes using the same directory.
+	</summary>
+'''
+class ResultCache:
+    DEFAULT_CAPACITY = 32
+    DEFAULT_MAX_BYTES = 256 * 2**20
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()
+        self._disk = CostCache(directory, max_bytes) if directory is not None else None
+
+    # Parameters must be plain values (numbers, strings, None) for the key to mean anything
+    def key(self, scenario, algorithm, params):
+        digest = hashlib.sha256()
+        digest.update(repr((CostCache.FORMAT_VERSION, scenario.fingerprint(), algorithm,
+                            sorted(params.items()))).encode())
+        return digest.hexdigest()
+
+    ''' <summary>
+		Looks the key up in memory and then on disk, marking it recently used.
+		</summary>
+		<returns>dictionary with the tour 'order', the 'results' fields, the
+		'budget' it was solved with and whether it was 'complete', or None</returns>
+	'''
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        arrays = self._disk.load(key, ('order', 'meta')) if self._disk is not None else None
+        if arrays is None:
+            return None
+        entry = json.loads(str(arrays['meta']))
+        entry['order'] = np.array(arrays['order'])
+        self._remember(key, entry)
+        return entry
+
+    ''' <summary>
+		Stores a solver's results dictionary.  Only its JSON-representable fields
+		are kept; the solution itself is kept as the order of its city indices.
+		The solver's resumable 'state' is only kept in memory.
+		</summary>
+	'''
+    def put(self, key, results, budget, complete):
+        fields = {}
+        for name, value in results.items():
+            if name in ('soln', 'state'):
+                continue
+            value = value.item() if isinstance(value, np.generic) else value
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                continue
+            fields[name] = value
+        entry = {'results': fields, 'budget': budget, 'complete': complete,
+                 'order': np.array([city._index for city in results['soln'].route], dtype=np.int64),
+                 'state': results.get('state')}
+        self._remember(key, entry)
+        if self._disk is not None:
+            meta = {name: value for name, value in entry.items() if name not in ('order', 'state')}
+            self._disk.store(key, {'order': entry['order'], 'meta': np.array(json.dumps(meta))}, replace=True)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
@@ -1,10 +1,14 @@
 #!/usr/bin/python3
 
 
+import bisect
+import hashlib
 import math
 import numpy as np
 import random
 import time
+import weakref
+from multiprocessing import shared_memory
 
 
 
@@ -58,7 +62,24 @@ class Scenario:
 
 	HARD_MODE_FRACTION_TO_REMOVE = 0.20 # Remove 20% of the edges
 
-	def __init__( self, city_locations, difficulty, rand_seed ):
+	# Stand-in cost for a missing edge (and the diagonal) in the cost matrix.  It is
+	# finite so tour costs can be summed and differenced, but larger than any real
+	# tour, so a search never trades a real edge for a missing one.
+	INFEASIBLE_COST = 1.0e10
+
+	# From this many cities on, scenarios default to sparse mode: no n x n arrays at
+	# all, just the coordinates and the removed edges (see SparseEdgeMask), with
+	# costs computed on demand by a LazyCostMatrix.  A dense cost matrix for 10000
+	# cities is already 800 MB.
+	SPARSE_THRESHOLD = 10000
+
+	# Backing arrays of the dense mask and matrices once the scenario has been edited
+	# (see _resize), keyed by attribute name
+	_buffers = None
+	_feasibility = None			# FeasibilityIndex, built on first use
+	_DENSE_ARRAYS = ( ('_edge_exists', False), ('_cost_matrix', INFEASIBLE_COST), ('_explicit_costs', 0.0) )
+
+	def __init__( self, city_locations, difficulty, rand_seed, sparse=None, cost_cache=None ):
 		self._difficulty = difficulty
 
 		if difficulty == "Normal" or difficulty == "Hard":
@@ -81,18 +102,379 @@ class Scenario:
 			city.setIndexAndName( num, nameForInt( num+1 ) )
 			num += 1
 
-		# Assume all edges exists except self-edges
 		ncities = len(self._cities)
-		self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
+		self._sparse = ncities >= self.SPARSE_THRESHOLD if sparse is None else sparse
+		self._cost_matrix = None
+		self._lazy_costs = None
+		self._explicit_costs = None
+		self._fingerprint = None
+
+		# With a TSPCache.CostCache, a scenario built before maps its stored edges and
+		# costs instead of thinning and costing all over again
+		key = cost_cache.key( self, rand_seed ) if cost_cache is not None else None
+		cached = cost_cache.load( key, self._cacheNames() ) if key is not None else None
+		if cached is not None:
+			self._useCached( cached )
+			return
+
+		# Assume all edges exists except self-edges
+		if self._sparse:
+			self._edge_exists = SparseEdgeMask( ncities )
+		else:
+			self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
 
 		if difficulty == "Hard":
 			self.thinEdges()
 		elif difficulty == "Hard (Deterministic)":
 			self.thinEdges(deterministic=True)
 
+		if key is not None:
+			cost_cache.store( key, self._cacheArrays() )
+
 	def getCities( self ):
 		return self._cities
 
+	# What a CostCache keeps for this scenario, and how the scenario takes it back
+	def _cacheNames( self ):
+		return ( 'indptr', 'indices' ) if self._sparse else ( 'edges', 'costs' )
+
+	def _cacheArrays( self ):
+		if self._sparse:
+			return { 'indptr': self._edge_exists.indptr, 'indices': self._edge_exists.indices }
+		return { 'edges': self._edge_exists, 'costs': self.getCostMatrix() }
+
+	def _useCached( self, arrays ):
+		if self._sparse:
+			self._edge_exists = SparseEdgeMask( len(self._cities), arrays['indptr'], arrays['indices'] )
+		else:
+			self._edge_exists = arrays['edges']
+			self._cost_matrix = arrays['costs']
+
+	def isSparse( self ):
+		return self._sparse
+
+	# x, y and elevation of every city as float arrays
+	def getCoordinates( self ):
+		return ( np.array( [c._x for c in self._cities], dtype=float ),
+				 np.array( [c._y for c in self._cities], dtype=float ),
+				 np.array( [c._elevation for c in self._cities], dtype=float ) )
+
+	''' <summary>
+		A scenario from arrays instead of GUI points and a seed, e.g. one read back
+		by TSPIO.  coords is n x 2, or n x 3 with elevations; difficulty picks the
+		cost function as usual; removed is the removed edges in CSR form (indptr,
+		indices) as in SparseEdgeMask; and costs, if given, is an explicit n x n
+		matrix that replaces the coordinate-based costs (the coordinates are then
+		only for drawing).  Nothing is thinned or drawn at random.
+		</summary> '''
+	@classmethod
+	def fromArrays( cls, coords, difficulty='Easy', removed=None, costs=None, sparse=None ):
+		coords = np.asarray( coords, dtype=float )
+		if coords.shape[1] == 2:
+			coords = np.column_stack( (coords, np.zeros( len(coords) )) )
+		ncities = len(coords)
+
+		scenario = cls.__new__( cls )
+		scenario._difficulty = difficulty
+		scenario._cities = [City( x, y, elevation ) for x, y, elevation in coords.tolist()]
+		for num, city in enumerate( scenario._cities ):
+			city.setScenario( scenario )
+			city.setIndexAndName( num, nameForInt( num+1 ) )
+		# an explicit matrix is dense already, so there is nothing to gain from sparse mode
+		scenario._sparse = costs is None and ( ncities >= cls.SPARSE_THRESHOLD if sparse is None else sparse )
+		scenario._cost_matrix = None
+		scenario._lazy_costs = None
+		scenario._explicit_costs = None if costs is None else np.asarray( costs, dtype=float )
+		scenario._fingerprint = None
+		mask = SparseEdgeMask( ncities ) if removed is None else SparseEdgeMask( ncities, *removed )
+		scenario._edge_exists = mask if scenario._sparse else np.asarray( mask )
+		return scenario
+
+	# The removed edges (diagonal excluded) as CSR arrays (indptr, indices), whichever way they are stored
+	def getRemovedEdges( self ):
+		if self._sparse:
+			return self._edge_exists.indptr, self._edge_exists.indices
+		missing = ~self._edge_exists
+		np.fill_diagonal( missing, False )
+		indptr = np.zeros( len(self._cities)+1, dtype=np.int64 )
+		np.cumsum( missing.sum( axis=1 ), out=indptr[1:] )
+		return indptr, np.nonzero( missing )[1].astype( np.int32 )
+
+	def hasExplicitCosts( self ):
+		return self._explicit_costs is not None
+
+	def hasRemovedEdges( self ):
+		if self._sparse:
+			return self._edge_exists.removedCount() > 0
+		ncities = len(self._cities)
+		return np.count_nonzero( self._edge_exists ) < ncities*(ncities-1)
+
+	# Whether every cost equals its reverse: Easy (no elevation) with no edges removed
+	def isSymmetric( self ):
+		if self._difficulty != 'Easy' or self.hasExplicitCosts():
+			return False
+		return not self.hasRemovedEdges()
+
+	''' <summary>
+		Hash of everything the solvers see: coordinates and elevations, difficulty,
+		the removed edges and any explicit costs.  Two scenarios with the same
+		fingerprint have the same cost for every edge, however they were built.
+		Computed on first use and cached.
+		</summary> '''
+	def fingerprint( self ):
+		if self._fingerprint is None:
+			digest = hashlib.sha256( repr( (self._difficulty, len(self._cities)) ).encode() )
+			digest.update( np.ascontiguousarray( np.column_stack( self.getCoordinates() ) ).tobytes() )
+			for array in self.getRemovedEdges():
+				digest.update( np.ascontiguousarray( array, dtype=np.int64 ).tobytes() )
+			if self._explicit_costs is not None:
+				digest.update( np.ascontiguousarray( self._explicit_costs ).tobytes() )
+			self._fingerprint = digest.hexdigest()
+		return self._fingerprint
+
+	''' <summary>
+		Publishes the coordinates/elevations, the edge mask and the cost matrix in
+		shared memory so that worker processes can attach to them instead of each
+		unpickling its own copy of the scenario.  A sparse scenario publishes just
+		the coordinates and its SparseEdgeMask's CSR arrays, never n x n arrays.  Use the returned SharedScenario as
+		a context manager (or call close()) in the process that owns the scenario;
+		pass its handle to the workers and rebuild the scenario there with attach().
+		</summary> '''
+	def share( self ):
+		return SharedScenario( self )
+
+	''' <summary>
+		Worker-side counterpart of share(): a read-only Scenario whose edge mask and
+		cost matrix (or, for a sparse scenario, removed edges) are zero-copy views
+		of the published shared memory.
+		</summary> '''
+	@classmethod
+	def attach( cls, handle ):
+		blocks = {}
+		arrays = {}
+		for name, (block_name, shape, dtype) in handle['blocks'].items():
+			blocks[name] = shared_memory.SharedMemory( name=block_name )
+			arrays[name] = np.ndarray( shape, dtype=dtype, buffer=blocks[name].buf )
+			arrays[name].flags.writeable = False
+
+		scenario = cls.__new__( cls )
+		scenario._difficulty = handle['difficulty']
+		scenario._cities = [City( x, y, elevation ) for x, y, elevation in arrays['coords'].tolist()]
+		for num, city in enumerate( scenario._cities ):
+			city.setScenario( scenario )
+			city.setIndexAndName( num, nameForInt( num+1 ) )
+		scenario._sparse = handle['sparse']
+		if scenario._sparse:
+			scenario._edge_exists = SparseEdgeMask( len(scenario._cities), arrays['indptr'], arrays['indices'] )
+			scenario._cost_matrix = None
+		else:
+			scenario._edge_exists = arrays['edges']
+			scenario._cost_matrix = arrays['costs']
+		scenario._lazy_costs = None
+		scenario._explicit_costs = arrays['costs'] if handle['explicit'] else None
+		scenario._fingerprint = None
+		scenario._shared_blocks = blocks			# keeps the mappings alive as long as the scenario
+		return scenario
+
+	''' <summary>
+		Dense matrix of City.costTo for every pair of cities, computed in one
+		vectorized pass and cached.  Missing edges hold INFEASIBLE_COST instead of
+		inf (see above).
+		</summary> '''
+	def getCostMatrix( self ):
+		if self._cost_matrix is None:
+			if self._explicit_costs is not None:
+				costs = self._explicit_costs.copy()
+			else:
+				xs, ys, zs = self.getCoordinates()
+				src = np.arange( len(self._cities) )[:,None]
+				costs = _pairCosts( xs, ys, zs, self._difficulty, src, src.T )
+			costs[~np.asarray( self._edge_exists )] = self.INFEASIBLE_COST
+			self._cost_matrix = costs
+		return self._cost_matrix
+
+	''' <summary>
+		The costs in whichever form the scenario keeps them: the dense matrix of
+		getCostMatrix(), or for a sparse scenario a LazyCostMatrix that takes the
+		same [src, dst] indexing and computes the costs it is asked for.  Solvers
+		that only look up individual edges and rows should use this rather than
+		getCostMatrix().
+		</summary> '''
+	def getCosts( self ):
+		if not self._sparse:
+			return self.getCostMatrix()
+		if self._lazy_costs is None:
+			self._lazy_costs = LazyCostMatrix( self )
+		return self._lazy_costs
+
+	# The scenario's FeasibilityIndex, built on first use and kept until the next edit.
+	# It holds every existing edge, so it is for dense scenarios; a sparse one has
+	# its removed edges in SparseEdgeMask instead.
+	def getFeasibility( self ):
+		if self._feasibility is None:
+			self._feasibility = FeasibilityIndex( self.getCosts(), self.INFEASIBLE_COST )
+		return self._feasibility
+
+	''' <summary>
+		Incremental editing.  addCity, moveCity, removeCity and setEdge change the
+		scenario in place and update just the rows and columns of the edge mask and
+		cached cost matrix that involve the edited cities, so a few edits to a
+		large scenario cost O(n) each rather than a rebuild.  The dense arrays live
+		in buffers with room to grow (see _resize).  removeCity keeps City._index
+		compact by moving the last city into the freed index.  Tours over the old
+		scenario can be patched up with TSPLocalSearch.cheapest_insertion,
+		delete_city and repair_tour.  Scenarios with explicit costs have no
+		geometry to cost new or moved cities by, so only removeCity and setEdge
+		work on them.
+		</summary> '''
+	# Time Complexity: O(n) amortized (sparse: O(n + removed edges))
+	def addCity( self, x, y, elevation=None ):
+		self._checkGeometric()
+		if elevation is None:
+			elevation = 0.0 if self._difficulty == 'Easy' else random.uniform( 0.0, 1.0 )
+		index = len(self._cities)
+		city = City( x, y, elevation )
+		city.setScenario( self )
+		city.setIndexAndName( index, nameForInt( index+1 ) )
+		self._cities.append( city )
+		if self._sparse:
+			mask = self._edge_exists
+			self._edge_exists = SparseEdgeMask( index+1, np.append( mask.indptr, mask.indptr[-1] ), mask.indices )
+		else:
+			self._resize( index+1 )
+			self._edge_exists[index, :] = True
+			self._edge_exists[:, index] = True
+			self._edge_exists[index, index] = False
+			self._updateCosts( index )
+		self._edited()
+		return city
+
+	# Time Complexity: O(n)
+	def moveCity( self, index, x, y, elevation=None ):
+		self._checkGeometric()
+		city = self._cities[index]
+		city._x, city._y = x, y
+		if elevation is not None:
+			city._elevation = elevation
+		if not self._sparse:
+			self._resize( len(self._cities) )
+			self._updateCosts( index )
+		self._edited()
+
+	''' <summary>
+		Removes the city at index.  The last city takes over its index and name,
+		so indices stay 0..n-1 and names keep following them.
+		</summary>
+		<returns>the old index of the city that moved into index, or None if the
+		removed city was the last one</returns>
+	'''
+	# Time Complexity: O(n) (sparse: O(n + removed edges))
+	def removeCity( self, index ):
+		last = len(self._cities) - 1
+		removed = self._cities[index]
+		moved = self._cities.pop()
+		if index != last:
+			self._cities[index] = moved
+			moved.setIndexAndName( index, nameForInt( index+1 ) )
+		removed.setScenario( None )
+		removed.setIndexAndName( -1, removed._name )
+
+		if self._sparse:
+			rows, cols = self._removedPairs()
+			keep = ( rows != index ) & ( cols != index )
+			rows, cols = rows[keep], cols[keep]
+			rows[rows == last] = index
+			cols[cols == last] = index
+			self._edge_exists = SparseEdgeMask( last, *_csr( last, rows, cols ) )
+		else:
+			self._resize( last+1 )
+			for name, _ in self._DENSE_ARRAYS:
+				array = getattr( self, name )
+				if array is not None and index != last:
+					# the column copy also carries the diagonal over: [last, last] -> [index, index]
+					array[index, :] = array[last, :]
+					array[:, index] = array[:, last]
+			self._resize( last )
+		self._edited()
+		return last if index != last else None
+
+	# Adds (exists=True) or removes the directed edge src -> dst
+	# Time Complexity: O(1) (sparse: O(n + removed edges))
+	def setEdge( self, src, dst, exists=True ):
+		if src == dst:
+			raise ValueError( 'a city has no edge to itself' )
+		if self._sparse:
+			if bool( self._edge_exists[src, dst] ) != bool( exists ):
+				rows, cols = self._removedPairs()
+				if exists:
+					drop = ( rows == src ) & ( cols == dst )
+					rows, cols = rows[~drop], cols[~drop]
+				else:
+					rows, cols = np.append( rows, src ), np.append( cols, dst )
+				self._edge_exists = SparseEdgeMask( len(self._cities), *_csr( len(self._cities), rows, cols ) )
+		else:
+			self._resize( len(self._cities) )
+			self._edge_exists[src, dst] = exists
+			if self._cost_matrix is not None:
+				self._cost_matrix[src, dst] = self._edgeCosts( src, dst ) if exists else self.INFEASIBLE_COST
+		self._edited()
+
+	def _checkGeometric( self ):
+		if self._explicit_costs is not None:
+			raise ValueError( 'cities cannot be added or moved in a scenario with explicit costs' )
+
+	def _edited( self ):
+		self._fingerprint = None
+		self._lazy_costs = None
+		self._feasibility = None
+
+	# The removed edges of a sparse scenario as (src, dst) arrays
+	def _removedPairs( self ):
+		mask = self._edge_exists
+		rows = np.repeat( np.arange( len(mask.indptr)-1 ), np.diff( mask.indptr ) )
+		return rows, mask.indices.astype( np.int64 )
+
+	''' <summary>
+		Points each dense array at the top-left ncities x ncities block of its
+		edit buffer.  A buffer is allocated (half as large again as needed, so
+		repeated addCity calls are amortized O(n)) the first time an array is
+		edited, when it has outgrown its buffer, or when it was replaced, e.g.
+		by a freshly computed cost matrix; cached and shared arrays are read-only,
+		so this also gives the edits a private copy.
+		</summary> '''
+	def _resize( self, ncities ):
+		if self._buffers is None:
+			self._buffers = {}
+		for name, fill in self._DENSE_ARRAYS:
+			array = getattr( self, name )
+			if array is None:
+				continue
+			buffer = self._buffers.get( name )
+			if buffer is None or array.base is not buffer or len(buffer) < ncities:
+				capacity = ncities + ncities // 2 + 1
+				buffer = np.full( (capacity, capacity), fill, dtype=array.dtype )
+				old = min( len(array), ncities )
+				buffer[:old, :old] = array[:old, :old]
+				self._buffers[name] = buffer
+			setattr( self, name, buffer[:ncities, :ncities] )
+
+	# Costs of the edges src -> dst (broadcast index arrays), ignoring whether they exist
+	def _edgeCosts( self, src, dst ):
+		if self._explicit_costs is not None:
+			return self._explicit_costs[src, dst]
+		xs, ys, zs = self.getCoordinates()
+		return _pairCosts( xs, ys, zs, self._difficulty, src, dst )
+
+	# Recomputes the row and column of index in the cached cost matrix
+	# Time Complexity: O(n)
+	def _updateCosts( self, index ):
+		if self._cost_matrix is None:
+			return
+		everyone = np.arange( len(self._cities) )
+		self._cost_matrix[index, :] = np.where( self._edge_exists[index, :], self._edgeCosts( index, everyone ),
+												self.INFEASIBLE_COST )
+		self._cost_matrix[:, index] = np.where( self._edge_exists[:, index], self._edgeCosts( everyone, index ),
+												self.INFEASIBLE_COST )
 
 	def randperm( self, n ):				#isn't there a numpy function that does this and even gets called in Solver?
 		perm = np.arange(n)
@@ -104,6 +486,9 @@ class Scenario:
 		return perm
 
 	def thinEdges( self, deterministic=False ):
+		if self._sparse:
+			self._thinSparseEdges( deterministic )
+			return
 		ncities = len(self._cities)
 		edge_count = ncities*(ncities-1) # can't have self-edge
 		num_to_remove = np.floor(self.HARD_MODE_FRACTION_TO_REMOVE*edge_count)
@@ -128,6 +513,51 @@ class Scenario:
 			if self._edge_exists[src,dst] and can_delete[src,dst]:
 				self._edge_exists[src,dst] = False
 				num_to_remove -= 1
+		self._cost_matrix = None
+		self._feasibility = None
+
+	''' <summary>
+		thinEdges for sparse scenarios.  Drawing edges one at a time would take
+		hours at this size, so instead every city's out-edges are thinned in one
+		vectorized draw: the number removed from each row comes from a multinomial
+		over the rows, and the removed destinations are sampled without replacement
+		from everything but the city itself and its successor on the kept route.
+		The random stream comes from the same source as in thinEdges (numpy's, or
+		the seeded random module when deterministic), but the edges removed differ
+		from what a dense scenario with the same seed would remove.
+		</summary> '''
+	# Time Complexity: O(n + edges removed)
+	# Space Complexity: O(n + edges removed)
+	def _thinSparseEdges( self, deterministic=False ):
+		ncities = len(self._cities)
+		if ncities < 3:
+			return
+		if deterministic:
+			rng = np.random.default_rng( random.getrandbits( 64 ) )
+		else:
+			rng = np.random.default_rng( np.random.randint( 2**31 ) )
+		num_to_remove = int( np.floor( self.HARD_MODE_FRACTION_TO_REMOVE*ncities*(ncities-1) ) )
+
+		# Set aside a route to ensure at least one tour exists
+		route_keep = rng.permutation( ncities )
+		keep = np.empty( ncities, dtype=np.int64 )
+		keep[route_keep] = np.roll( route_keep, -1 )
+
+		counts = rng.multinomial( num_to_remove, np.full( ncities, 1.0/ncities ) )
+		counts = np.minimum( counts, ncities-2 )
+		indptr = np.zeros( ncities+1, dtype=np.int64 )
+		np.cumsum( counts, out=indptr[1:] )
+		indices = np.empty( indptr[-1], dtype=np.int32 )
+		for src in range( ncities ):
+			# shift draws from [0, n-2) past the two excluded destinations, lower one first
+			dst = rng.choice( ncities-2, size=counts[src], replace=False )
+			for skip in sorted( (src, keep[src]) ):
+				dst += dst >= skip
+			indices[indptr[src]:indptr[src+1]] = np.sort( dst )
+		self._edge_exists = SparseEdgeMask( ncities, indptr, indices )
+		self._cost_matrix = None
+		self._lazy_costs = None
+		self._feasibility = None
 
 
 
@@ -164,6 +594,10 @@ class City:
 		if not self._scenario._edge_exists[self._index, other_city._index]:
 			return np.inf
 
+		# Scenarios read with explicit edge weights have no geometry to cost
+		if self._scenario._explicit_costs is not None:
+			return int( self._scenario._explicit_costs[self._index, other_city._index] )
+
 		# Euclidean Distance
 		cost = math.sqrt( (other_city._x - self._x)**2 +
 						  (other_city._y - self._y)**2 )
@@ -177,3 +611,285 @@ class City:
 
 		return int(math.ceil(cost * self.MAP_SCALE))
 
+
+
+# costTo for every (src, dst) pair of the broadcast index arrays, ignoring missing edges
+def _pairCosts( xs, ys, zs, difficulty, src, dst ):
+	cost = np.sqrt( (xs[dst] - xs[src])**2 + (ys[dst] - ys[src])**2 )
+	if not difficulty == 'Easy':
+		cost = np.maximum( cost + (zs[dst] - zs[src]), 0.0 )
+	return np.ceil( cost * City.MAP_SCALE )
+
+
+# CSR arrays (indptr, indices) of the (src, dst) pairs, rows sorted
+def _csr( ncities, rows, cols ):
+	order = np.lexsort( (cols, rows) )
+	indptr = np.zeros( ncities+1, dtype=np.int64 )
+	np.cumsum( np.bincount( rows, minlength=ncities ), out=indptr[1:] )
+	return indptr, cols[order].astype( np.int32 )
+
+
+class SparseEdgeMask:
+	''' Stand-in for the dense _edge_exists mask of a sparse scenario.  Only the
+		removed edges are stored, in CSR form: the removed destinations of city src
+		are indices[indptr[src]:indptr[src+1]], sorted, so memory is O(n + edges
+		removed).  mask[src, dst] answers like the dense mask, for single cities or
+		for broadcast index arrays (a vectorized binary search within each row), and
+		np.asarray( mask ) builds the dense mask for code that needs one. '''
+
+	def __init__( self, ncities, indptr=None, indices=None ):
+		self.shape = ( ncities, ncities )
+		self.indptr = np.zeros( ncities+1, dtype=np.int64 ) if indptr is None else indptr
+		self.indices = np.empty( 0, dtype=np.int32 ) if indices is None else indices
+		# plain Python views for the single-edge lookups, which numpy calls would dominate
+		self._rows = self.indptr.tolist()
+		self._steps = int( np.diff( self.indptr ).max( initial=0 ) ).bit_length()
+		self._row_view = memoryview( self.indices )
+
+	def removedCount( self ):
+		return len( self.indices )
+
+	def __getitem__( self, key ):
+		src, dst = key
+		if isinstance( src, (int, np.integer) ) and isinstance( dst, (int, np.integer) ):
+			if src == dst:
+				return False
+			lo, hi = self._rows[src], self._rows[src+1]
+			if lo == hi:
+				return True
+			i = lo + bisect.bisect_left( self._row_view[lo:hi], dst )
+			return not ( i < hi and self._row_view[i] == dst )
+		src, dst = np.broadcast_arrays( np.asarray( src ), np.asarray( dst ) )
+		if len( self.indices ) == 0:
+			return src != dst
+		lo = self.indptr[src]
+		length = self.indptr[src+1] - lo
+		last = len( self.indices ) - 1
+		# lower bound of dst in every row at once, in O(log(longest row)) vectorized steps
+		for _ in range( self._steps ):
+			half = length >> 1
+			below = ( length > 0 ) & ( self.indices[np.minimum( lo + half, last )] < dst )
+			lo = np.where( below, lo + half + 1, lo )
+			length = np.where( below, length - half - 1, half )
+		found = lo < self.indptr[src+1]
+		found[found] = self.indices[lo[found]] == dst[found]
+		return ~found & ( src != dst )
+
+	def __array__( self, dtype=None, copy=None ):
+		ncities = self.shape[0]
+		mask = ~np.eye( ncities, dtype=bool )
+		rows = np.repeat( np.arange( ncities ), np.diff( self.indptr ) )
+		mask[rows, self.indices] = False
+		return mask if dtype is None else mask.astype( dtype )
+
+
+class FeasibilityIndex:
+	''' <summary>
+		The edges that exist, for searches on thinned scenarios: CSR adjacency
+		lists of every city's valid successors (succ_indices[succ_indptr[city]:
+		succ_indptr[city+1]]) and valid predecessors (pred_indptr, pred_indices),
+		each sorted by cost, plus the edge mask packed eight edges to a byte, so
+		exists( src, dst ) is a single byte lookup.  A constructor walks a
+		city's successors cheapest first and stops at the first unvisited one,
+		instead of costing every city, and a search can reject a move with a
+		missing edge before computing any of its costs.  Built a block of rows
+		at a time from the costs (a dense matrix or a LazyCostMatrix), so besides
+		the index itself it needs O(n) rows of memory; the index is O(edges).
+		</summary> '''
+
+	# Rows of the cost matrix sorted per block
+	BLOCK_ROWS = 256
+
+	# Time Complexity: O(n^2 log n)
+	# Space Complexity: O(edges)
+	def __init__( self, costs, infeasible_cost ):
+		ncities = costs.shape[0]
+		self.shape = ( ncities, ncities )
+		self.bits = np.empty( (ncities, (ncities+7)//8), dtype=np.uint8 )
+		self.succ_indptr, self.succ_indices = self._build( costs, infeasible_cost, False )
+		self.pred_indptr, self.pred_indices = self._build( costs, infeasible_cost, True )
+
+	def _build( self, costs, infeasible_cost, transpose ):
+		ncities = self.shape[0]
+		counts = np.zeros( ncities, dtype=np.int64 )
+		cities = np.arange( ncities )[None,:]
+		blocks = []
+		for lo in range( 0, ncities, self.BLOCK_ROWS ):
+			rows = slice( lo, min( lo+self.BLOCK_ROWS, ncities ) )
+			block = np.asarray( costs[cities, cities[0,rows,None]] if transpose else costs[cities[0,rows,None], cities] )
+			valid = block < infeasible_cost
+			if not transpose:
+				self.bits[rows] = np.packbits( valid, axis=1 )
+			order = np.argsort( block, axis=1, kind='stable' )
+			counts[rows] = valid.sum( axis=1 )
+			# missing edges cost the most, so each row's valid cities come first
+			blocks.append( order[np.take_along_axis( valid, order, axis=1 )].astype( np.int32 ) )
+		indptr = np.zeros( ncities+1, dtype=np.int64 )
+		np.cumsum( counts, out=indptr[1:] )
+		return indptr, np.concatenate( blocks ) if blocks else np.empty( 0, dtype=np.int32 )
+
+	# Whether the edge src -> dst exists, for single cities or broadcast index arrays
+	def exists( self, src, dst ):
+		if isinstance( src, (int, np.integer) ) and isinstance( dst, (int, np.integer) ):
+			return bool( self.bits[src, dst >> 3] & (128 >> (dst & 7)) )
+		src, dst = np.broadcast_arrays( np.asarray( src ), np.asarray( dst ) )
+		return ( self.bits[src, dst >> 3] & (128 >> (dst & 7)) ) != 0
+
+	# Valid successors of city, cheapest first
+	def successors( self, city ):
+		return self.succ_indices[self.succ_indptr[city]:self.succ_indptr[city+1]]
+
+	# Valid predecessors of city, cheapest first
+	def predecessors( self, city ):
+		return self.pred_indices[self.pred_indptr[city]:self.pred_indptr[city+1]]
+
+	# (out-degree, in-degree) of every city
+	def degrees( self ):
+		return np.diff( self.succ_indptr ), np.diff( self.pred_indptr )
+
+	# Candidate lists like TSPLocalSearch.neighbor_lists, straight from the sorted
+	# adjacency: the k cheapest valid successors and predecessors of each city
+	# Time Complexity: O(n k)
+	def neighbor_lists( self, k ):
+		ncities = self.shape[0]
+		return ( [self.succ_indices[self.succ_indptr[c]:min( self.succ_indptr[c]+k, self.succ_indptr[c+1] )]
+				  for c in range( ncities )],
+				 [self.pred_indices[self.pred_indptr[c]:min( self.pred_indptr[c]+k, self.pred_indptr[c+1] )]
+				  for c in range( ncities )] )
+
+
+class LazyCostMatrix:
+	''' The cost matrix of a sparse scenario without the n x n array: costs[src, dst]
+		works like indexing Scenario.getCostMatrix() (single cities, rows, or
+		broadcast index arrays, missing edges at INFEASIBLE_COST), but each lookup
+		computes its costs from the coordinates.  Memory is O(n) on top of the
+		scenario's SparseEdgeMask. '''
+
+	def __init__( self, scenario ):
+		self._xs, self._ys, self._zs = scenario.getCoordinates()
+		self._points = list( zip( self._xs.tolist(), self._ys.tolist(), self._zs.tolist() ) )
+		self._difficulty = scenario._difficulty
+		self._edge_exists = scenario._edge_exists
+		self._infeasible = scenario.INFEASIBLE_COST
+		self.shape = ( len(self._points), len(self._points) )
+
+	def coordinates( self ):
+		return self._xs, self._ys
+
+	def _index( self, key ):
+		if isinstance( key, slice ):
+			return np.arange( self.shape[0] )[key]
+		return np.asarray( key )
+
+	def __getitem__( self, key ):
+		src, dst = key if isinstance( key, tuple ) else ( key, slice(None) )
+		if isinstance( src, (int, np.integer) ) and isinstance( dst, (int, np.integer) ):
+			# the same arithmetic as City.costTo, without numpy overhead
+			if not self._edge_exists[src, dst]:
+				return self._infeasible
+			x1, y1, z1 = self._points[src]
+			x2, y2, z2 = self._points[dst]
+			cost = math.sqrt( (x2 - x1)**2 + (y2 - y1)**2 )
+			if not self._difficulty == 'Easy':
+				cost = max( cost + (z2 - z1), 0.0 )
+			return float( math.ceil( cost * City.MAP_SCALE ) )
+		src, dst = np.broadcast_arrays( self._index( src ), self._index( dst ) )
+		costs = _pairCosts( self._xs, self._ys, self._zs, self._difficulty, src, dst )
+		costs[~self._edge_exists[src, dst]] = self._infeasible
+		return costs
+
+	''' <summary>
+		Candidate lists like TSPLocalSearch.neighbor_lists, without looking at all
+		n^2 costs: the cities are bucketed on a grid with about k/2 cities per cell,
+		and each cell compares its cities only with the cities of the surrounding
+		5 x 5 block of cells (widened where that holds too few).  Elevation makes
+		the costs asymmetric, so a candidate list can miss a cheap edge to a far
+		away city; for local search that only costs a little quality.
+		</summary>
+		<returns>(out lists, in lists): each city's k cheapest successors and
+		predecessors among its grid neighbors, sorted by cost</returns> '''
+	# Time Complexity: O(n k) cost evaluations
+	# Space Complexity: O(n k)
+	def neighbor_lists( self, k ):
+		ncities = self.shape[0]
+		k = max( 1, min( k, ncities-1 ) )
+		side = max( 1, int( math.sqrt( ncities / max( k/2, 1 ) ) ) )
+
+		def grid( values ):
+			span = max( values.max() - values.min(), 1e-12 )
+			return np.minimum( ( (values - values.min()) / span * side ).astype( np.int64 ), side-1 )
+
+		cx, cy = grid( self._xs ), grid( self._ys )
+		cell = cx*side + cy
+		by_cell = np.argsort( cell, kind='stable' )
+		starts = np.searchsorted( cell[by_cell], np.arange( side*side+1 ) )
+
+		out_lists = [None] * ncities
+		in_lists = [None] * ncities
+		for c in np.unique( cell ).tolist():
+			members = by_cell[starts[c]:starts[c+1]]
+			x, y = divmod( c, side )
+			radius = 2
+			while True:
+				ylo, yhi = max( y-radius, 0 ), min( y+radius, side-1 )
+				# for a fixed x, the cells y-radius..y+radius are one run of by_cell
+				candidates = np.concatenate( [by_cell[starts[row*side + ylo]:starts[row*side + yhi + 1]]
+											  for row in range( max( x-radius, 0 ), min( x+radius, side-1 ) + 1 )] )
+				if len( candidates ) > k or radius >= side:
+					break
+				radius *= 2
+			itself = members[:,None] == candidates[None,:]
+			for lists, costs in ( ( out_lists, self[members[:,None], candidates[None,:]] ),
+								  ( in_lists, self[candidates[None,:], members[:,None]] ) ):
+				costs[itself] = np.inf
+				count = min( k, len( candidates ) - 1 )
+				nearest = np.argpartition( costs, count-1, axis=1 )[:,:count]
+				nearest_costs = np.take_along_axis( costs, nearest, axis=1 )
+				nearest = np.take_along_axis( nearest, np.argsort( nearest_costs, axis=1, kind='stable' ), axis=1 )
+				for city, row in zip( members.tolist(), candidates[nearest] ):
+					lists[city] = row[row != city][:count]
+		return out_lists, in_lists
+
+
+def _releaseSharedBlocks( blocks ):
+	for block in blocks:
+		block.close()
+		try:
+			block.unlink()
+		except FileNotFoundError:
+			pass
+
+
+class SharedScenario:
+	''' Owner side of Scenario.share().  The shared memory blocks are unlinked by
+		close(), on leaving a with block, or at the latest when this object is
+		garbage collected or the interpreter exits, so they never outlive the run. '''
+
+	def __init__( self, scenario ):
+		cities = scenario.getCities()
+		arrays = { 'coords': np.array( [(c._x, c._y, c._elevation) for c in cities], dtype=float ).reshape( -1, 3 ) }
+		if scenario.isSparse():
+			arrays['indptr'] = np.ascontiguousarray( scenario._edge_exists.indptr )
+			arrays['indices'] = np.ascontiguousarray( scenario._edge_exists.indices )
+		else:
+			arrays['edges'] = np.ascontiguousarray( scenario._edge_exists )
+			arrays['costs'] = np.ascontiguousarray( scenario.getCostMatrix() )
+
+		self._blocks = []
+		self.handle = { 'difficulty': scenario._difficulty, 'explicit': scenario.hasExplicitCosts(),
+						'sparse': scenario.isSparse(), 'blocks': {} }
+		self._finalizer = weakref.finalize( self, _releaseSharedBlocks, self._blocks )
+		for name, array in arrays.items():
+			block = shared_memory.SharedMemory( create=True, size=max( 1, array.nbytes ) )
+			self._blocks.append( block )
+			np.ndarray( array.shape, dtype=array.dtype, buffer=block.buf )[...] = array
+			self.handle['blocks'][name] = ( block.name, array.shape, array.dtype.str )
+
+	def close( self ):
+		self._finalizer()
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, *exc_info ):
+		self.close()
@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+
+import numpy as np
+from TSPClasses import *
+
+
+''' <summary>
+	Reading and writing scenarios and tours: a compact .npz format for our own
+	scenarios (coordinates, elevations, difficulty, removed edges) and tours
+	(index arrays), and TSPLIB .tsp/.atsp/.tour files for exchanging instances
+	and results with other tools.  The TSPLIB readers and writers go through the
+	file a line at a time, and the writers compute the cost matrix a row at a
+	time, so neither ever holds the text of a whole instance in memory.
+	</summary>
+'''
+
+SCENARIO_FORMAT = 'tsp-scenario-1'
+TOUR_FORMAT = 'tsp-tour-1'
+
+
+# Time Complexity: O(n + removed edges)
+def save_scenario(scenario, path):
+    xs, ys, zs = scenario.getCoordinates()
+    indptr, indices = scenario.getRemovedEdges()
+    arrays = {'format': np.array(SCENARIO_FORMAT), 'difficulty': np.array(scenario._difficulty),
+              'coords': np.column_stack((xs, ys, zs)), 'indptr': indptr, 'indices': indices}
+    if scenario.hasExplicitCosts():
+        arrays['costs'] = scenario._explicit_costs
+    np.savez_compressed(path, **arrays)
+
+
+def load_scenario(path, sparse=None):
+    with np.load(path) as data:
+        if str(data['format']) != SCENARIO_FORMAT:
+            raise ValueError('%s is not a saved scenario' % path)
+        costs = data['costs'] if 'costs' in data else None
+        return Scenario.fromArrays(data['coords'], str(data['difficulty']), (data['indptr'], data['indices']),
+                                   costs, sparse)
+
+
+# order is an index array (or a TSPSolution); cost is stored alongside when given
+def save_tour(order, path, cost=None):
+    if isinstance(order, TSPSolution):
+        order, cost = [city._index for city in order.route], order.cost if cost is None else cost
+    arrays = {'format': np.array(TOUR_FORMAT), 'order': np.asarray(order, dtype=np.int64)}
+    if cost is not None:
+        arrays['cost'] = np.array(cost, dtype=float)
+    np.savez_compressed(path, **arrays)
+
+
+# Returns (order, cost), cost None if it was not saved
+def load_tour(path):
+    with np.load(path) as data:
+        if str(data['format']) != TOUR_FORMAT:
+            raise ValueError('%s is not a saved tour' % path)
+        return data['order'], float(data['cost']) if 'cost' in data else None
+
+
+''' <summary>
+	Splits a TSPLIB file into its specification ("KEY : value") and its data
+	sections.  Yields ('spec', key, value) per keyword and ('data', section,
+	line) per line of a data section, streaming through the file.
+	</summary>
+'''
+def _tsplib_lines(path):
+    section = None
+    with open(path) as lines:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line == 'EOF':
+                return
+            head = line.split(':', 1)[0].strip().upper()
+            if head.endswith('_SECTION'):
+                section = head
+                continue
+            if ':' in line:
+                section = None
+                yield 'spec', head, line.split(':', 1)[1].strip()
+            elif section is not None:
+                yield 'data', section, line
+
+
+# Fills an n x n matrix from the weights of an EXPLICIT instance, in the order the format lists them
+# Time Complexity: O(n^2)
+def _explicit_matrix(weights, n, layout):
+    matrix = np.zeros((n, n))
+    if layout == 'FULL_MATRIX':
+        matrix[:] = weights.reshape(n, n)
+        return matrix
+    rows, cols = {'UPPER_ROW': np.triu_indices(n, 1), 'UPPER_DIAG_ROW': np.triu_indices(n),
+                  'LOWER_ROW': np.tril_indices(n, -1), 'LOWER_DIAG_ROW': np.tril_indices(n)}[layout]
+    matrix[rows, cols] = weights
+    matrix[cols, rows] = weights
+    return matrix
+
+
+# TSPLIB distances between coordinates, in TSPLIB units, a block of rows at a time
+# Time Complexity: O(n^2)
+def _coordinate_costs(coords, weight_type, block_rows=1024):
+    n = len(coords)
+    xs, ys = coords[:, 0], coords[:, 1]
+    matrix = np.empty((n, n))
+    for lo in range(0, n, block_rows):
+        rows = slice(lo, min(lo + block_rows, n))
+        distance = np.sqrt((xs[rows, None] - xs)**2 + (ys[rows, None] - ys)**2)
+        matrix[rows] = np.ceil(distance) if weight_type == 'CEIL_2D' else np.floor(distance + 0.5)
+    return matrix
+
+
+''' <summary>
+	Reads a TSPLIB .tsp or .atsp instance.  Coordinate instances (EUC_2D,
+	CEIL_2D) become an Easy scenario drawn at the coordinates divided by
+	City.MAP_SCALE, with the TSPLIB distances (rounded up for CEIL_2D, to the
+	nearest integer for EUC_2D) computed in TSPLIB units as explicit costs, so
+	they are exact: scaling down and back up in City.costTo would turn some
+	integer distances into the next integer.  From Scenario.SPARSE_THRESHOLD
+	cities on (or with sparse set), an explicit matrix would not fit, so the
+	scenario keeps the scaled coordinates and City.costTo's costs instead,
+	which can be one more than the TSPLIB distance.
+	EXPLICIT instances in FULL_MATRIX or any of the row formats become a
+	scenario with explicit costs, drawn at DISPLAY_DATA_SECTION coordinates if
+	there are any and on a circle otherwise.
+	</summary>
+	<returns>the Scenario, and the instance's NAME (or None)</returns>
+'''
+# Time Complexity: O(size of the file)
+def read_tsplib(path, sparse=None):
+    spec = {}
+    coords = None
+    weights = []
+    for kind, key, value in _tsplib_lines(path):
+        if kind == 'spec':
+            spec[key] = value
+            if key == 'DIMENSION':
+                coords = np.zeros((int(value), 2))
+        elif key in ('NODE_COORD_SECTION', 'DISPLAY_DATA_SECTION'):
+            node, x, y = value.split()[:3]
+            coords[int(node) - 1] = float(x), float(y)
+        elif key == 'EDGE_WEIGHT_SECTION':
+            weights.append(np.array(value.split(), dtype=float))
+    if coords is None:
+        raise ValueError('%s has no DIMENSION' % path)
+    n = len(coords)
+    weight_type = spec.get('EDGE_WEIGHT_TYPE', '').upper()
+
+    if weight_type in ('EUC_2D', 'CEIL_2D'):
+        if sparse or (sparse is None and n >= Scenario.SPARSE_THRESHOLD):
+            return Scenario.fromArrays(coords / City.MAP_SCALE, 'Easy', sparse=True), spec.get('NAME')
+        return Scenario.fromArrays(coords / City.MAP_SCALE, 'Easy', costs=_coordinate_costs(coords, weight_type)), \
+            spec.get('NAME')
+    if weight_type != 'EXPLICIT':
+        raise ValueError('unsupported EDGE_WEIGHT_TYPE %r in %s' % (weight_type, path))
+    matrix = _explicit_matrix(np.concatenate(weights), n, spec.get('EDGE_WEIGHT_FORMAT', 'FULL_MATRIX').upper())
+    if not coords.any():
+        angles = 2 * np.pi * np.arange(n) / n
+        coords = np.column_stack((np.cos(angles), np.sin(angles)))
+    # weights at INFEASIBLE_COST are how write_tsplib marks missing edges
+    missing = matrix >= Scenario.INFEASIBLE_COST
+    np.fill_diagonal(missing, False)
+    indptr = np.concatenate(([0], np.cumsum(missing.sum(axis=1))))
+    removed = (indptr, np.nonzero(missing)[1].astype(np.int32))
+    return Scenario.fromArrays(coords, 'Easy', removed, costs=matrix), spec.get('NAME')
+
+
+''' <summary>
+	Writes a scenario as TSPLIB.  An Easy scenario without removed edges or
+	explicit costs is symmetric and Euclidean, so it is written as a .tsp with
+	CEIL_2D coordinates scaled by City.MAP_SCALE; everything else is written as
+	an EXPLICIT FULL_MATRIX .atsp (missing edges at Scenario.INFEASIBLE_COST)
+	with the coordinates as display data.  The matrix is computed and written a
+	row at a time, so sparse scenarios can be exported too.
+	</summary>
+	<returns>the TSPLIB TYPE written, 'TSP' or 'ATSP'</returns>
+'''
+# Time Complexity: O(n^2) for ATSP, O(n) for TSP
+def write_tsplib(scenario, path, name=None):
+    xs, ys, _ = scenario.getCoordinates()
+    n = len(xs)
+    euclidean = scenario.isSymmetric()
+    kind = 'TSP' if euclidean else 'ATSP'
+    with open(path, 'w') as out:
+        out.write('NAME : %s\nTYPE : %s\nDIMENSION : %d\n' % (name or 'scenario', kind, n))
+        if euclidean:
+            out.write('EDGE_WEIGHT_TYPE : CEIL_2D\nNODE_COORD_SECTION\n')
+        else:
+            out.write('EDGE_WEIGHT_TYPE : EXPLICIT\nEDGE_WEIGHT_FORMAT : FULL_MATRIX\n'
+                      'DISPLAY_DATA_TYPE : TWOD_DISPLAY\nEDGE_WEIGHT_SECTION\n')
+            costs = scenario.getCosts()
+            for row in range(n):
+                out.write(' '.join(map(str, np.asarray(costs[row], dtype=np.int64).tolist())) + '\n')
+            out.write('DISPLAY_DATA_SECTION\n')
+        scale = City.MAP_SCALE if euclidean else 1.0
+        for node, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+            out.write('%d %r %r\n' % (node + 1, x * scale, y * scale))
+        out.write('EOF\n')
+    return kind
+
+
+# Returns the tour as a 0-based index array
+def read_tsplib_tour(path):
+    order = []
+    for kind, key, value in _tsplib_lines(path):
+        if kind == 'data' and key == 'TOUR_SECTION':
+            for node in value.split():
+                if int(node) == -1:
+                    return np.array(order, dtype=np.int64)
+                order.append(int(node) - 1)
+    return np.array(order, dtype=np.int64)
+
+
+# order is an index array or a TSPSolution
+def write_tsplib_tour(order, path, name=None, comment=None):
+    if isinstance(order, TSPSolution):
+        comment = 'Length = %d' % order.cost if comment is None and order.cost < np.inf else comment
+        order = [city._index for city in order.route]
+    with open(path, 'w') as out:
+        out.write('NAME : %s\n' % (name or 'tour'))
+        if comment is not None:
+            out.write('COMMENT : %s\n' % comment)
+        out.write('TYPE : TOUR\nDIMENSION : %d\nTOUR_SECTION\n' % len(order))
+        for city in np.asarray(order).tolist():
+            out.write('%d\n' % (city + 1))
+        out.write('-1\nEOF\n')
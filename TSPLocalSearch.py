@@ -0,0 +1,1344 @@
+#!/usr/bin/python3
+
+import collections
+import itertools
+import numpy as np
+
+
+''' <summary>
+	Index-array building blocks for the search-based solvers in TSPSolver.  Tours
+	are numpy arrays of city indices and costs come from Scenario.getCostMatrix(),
+	so a move is evaluated from a handful of matrix lookups instead of by building
+	and costing a whole new TSPSolution.
+	</summary>
+'''
+
+# Costs are integers, so anything smaller than this is rounding noise in the prefix sums
+IMPROVEMENT_EPSILON = 0.5
+
+
+# Time Complexity: O(n)
+# Space Complexity: O(n)
+def tour_cost(costs, order):
+    order = np.asarray(order)
+    return float(costs[order, np.roll(order, -1)].sum())
+
+
+# Costs of a whole population (one tour per row) in one vectorized lookup
+# Time Complexity: O(P n)
+# Space Complexity: O(P n)
+def population_costs(costs, population):
+    return costs[population, np.roll(population, -1, axis=1)].sum(axis=1)
+
+
+# successor[city] for every city of the tour
+def successors(order):
+    succ = np.empty(len(order), dtype=np.int64)
+    succ[order] = np.roll(order, -1)
+    return succ
+
+
+# A hashable key that is equal for equal tours, whatever city they start from: the
+# successor array, taken in the direction where city 0 leads to the smaller neighbour
+# when symmetric (a tour and its reverse are then the same tour)
+def tour_key(order, symmetric=False):
+    succ = successors(order)
+    if symmetric:
+        pred = np.empty_like(succ)
+        pred[succ] = np.arange(len(succ))
+        if pred[0] < succ[0]:
+            succ = pred
+    return succ.tobytes()
+
+
+# The tour of a successor array as an index array, starting from start
+# Time Complexity: O(n)
+def successor_order(succ, start=0):
+    order = np.empty(len(succ), dtype=np.int64)
+    city = start
+    for step in range(len(succ)):
+        order[step] = city
+        city = succ[city]
+    return order
+
+
+''' <summary>
+	A tour stored as an array of city indices plus each city's position in it.
+	Prefix sums of the forward and backward edge costs over the doubled tour let
+	path_cost and reversed_path_cost answer in O(1), which is what makes 2-opt
+	deltas O(1) even though the costs are asymmetric (reversing a path changes
+	the cost of every edge inside it).  reverse() is O(length of the path) and
+	the prefix sums are rebuilt lazily, in O(n), the next time they are needed.
+	While journal is a list, every reversal is appended to it so a batch of
+	moves can be taken back with undo_journal().
+	</summary>
+'''
+class ArrayTour:
+    def __init__(self, costs, order):
+        self.costs = costs
+        self.order = np.array(order, dtype=np.int64)
+        self.n = len(self.order)
+        self.pos = np.empty(self.n, dtype=np.int64)
+        self.pos[self.order] = np.arange(self.n)
+        self.journal = None
+        self._dirty = True
+
+    # Time Complexity: O(n)
+    # Space Complexity: O(n)
+    def _refresh(self):
+        doubled = np.concatenate((self.order, self.order))
+        self._forward = np.concatenate(([0.0], np.cumsum(self.costs[doubled[:-1], doubled[1:]])))
+        self._backward = np.concatenate(([0.0], np.cumsum(self.costs[doubled[1:], doubled[:-1]])))
+        self._dirty = False
+
+    def next(self, city):
+        return self.order[(self.pos[city] + 1) % self.n]
+
+    def prev(self, city):
+        return self.order[self.pos[city] - 1]
+
+    # True if b is visited on the way from a forward to c (inclusive)
+    def between(self, a, b, c):
+        start = self.pos[a]
+        return (self.pos[b] - start) % self.n <= (self.pos[c] - start) % self.n
+
+    # Number of steps forward from a to b
+    def distance(self, a, b):
+        return (self.pos[b] - self.pos[a]) % self.n
+
+    def _span(self, b, c):
+        i = self.pos[b]
+        j = self.pos[c]
+        if j < i:
+            j += self.n
+        return i, j
+
+    # Cost of walking forward from b to c
+    def path_cost(self, b, c):
+        if self._dirty:
+            self._refresh()
+        i, j = self._span(b, c)
+        return self._forward[j] - self._forward[i]
+
+    # Cost of walking the same path backwards, from c to b
+    def reversed_path_cost(self, b, c):
+        if self._dirty:
+            self._refresh()
+        i, j = self._span(b, c)
+        return self._backward[j] - self._backward[i]
+
+    # Reverses the path from b forward to c in place
+    # Time Complexity: O(length of the path)
+    def reverse(self, b, c):
+        if self.journal is not None:
+            self.journal.append((b, c))
+        i, j = self._span(b, c)
+        idx = np.arange(i, j + 1) % self.n
+        segment = self.order[idx][::-1]
+        self.order[idx] = segment
+        self.pos[segment] = idx
+        self._dirty = True
+
+    # Call after changing entries of the cost matrix in place
+    def invalidate(self):
+        self._dirty = True
+
+    def sequence(self):
+        return self.order.copy()
+
+    def cost(self):
+        if self._dirty:
+            self._refresh()
+        return self._forward[self.n]
+
+
+''' <summary>
+	A tour stored as a two-level doubly-linked list: the cities are cut into about
+	sqrt(n) segments, each a short list with a reversed bit, and the segments sit
+	in tour order on a ring.  Reversing a path splits at most two segments so the
+	path is a run of whole segments, then reverses that run on the ring and flips
+	the bits, so reverse() is O(sqrt(n)) where ArrayTour's is O(n); next, prev and
+	between stay O(1).  Every segment keeps prefix sums of its edge costs in both
+	directions, so after one O(sqrt(n)) pass over the ring distance, path_cost and
+	reversed_path_cost are O(1) as well.  Splitting keeps adding segments; once
+	there are twice as many as after a rebuild the lists are rebuilt in O(n).
+	Same interface as ArrayTour, minus the order and pos arrays (use sequence()).
+	</summary>
+'''
+class TwoLevelTour:
+    def __init__(self, costs, order):
+        self.costs = costs
+        self.n = len(order)
+        self.journal = None
+        self._build(np.asarray(order, dtype=np.int64))
+
+    # Time Complexity: O(n)
+    # Space Complexity: O(n)
+    def _build(self, order):
+        n = self.n
+        size = max(8, int(np.sqrt(n)))
+        segment_of = np.empty(n, dtype=np.int64)
+        segment_of[order] = np.arange(n) // size
+        index_of = np.empty(n, dtype=np.int64)
+        index_of[order] = np.arange(n) % size
+        self._city_seg = segment_of.tolist()
+        self._city_idx = index_of.tolist()
+        self._cities = [order[start:start + size].tolist() for start in range(0, n, size)]
+        self._reversed = [False] * len(self._cities)
+        self._forward = [None] * len(self._cities)
+        self._backward = [None] * len(self._cities)
+        self._max_segments = 2 * len(self._cities) + 2
+        # what _refresh needs from each segment, in stored order: first and last city,
+        # forward and backward cost, length (a reverse adds at most two segments)
+        self._summary = np.zeros((self._max_segments + 3, 5))
+        # the edge from each segment's last city to the next segment's first, both ways,
+        # as (from, to, forward cost, backward cost); only the few that moved get looked up
+        self._links = np.full((self._max_segments + 3, 4), -1.0)
+        # one vectorized lookup for the whole tour rather than one per segment
+        ahead = self.costs[order[:-1], order[1:]]
+        behind = self.costs[order[1:], order[:-1]]
+        for seg, start in enumerate(range(0, n, size)):
+            stop = min(start + size, n) - 1
+            self._store(seg, [0.0] + np.cumsum(ahead[start:stop]).tolist(),
+                        [0.0] + np.cumsum(behind[start:stop]).tolist())
+        self._ring = list(range(len(self._cities)))
+        self._renumber()
+
+    # Prefix sums of the segment's edge costs along its stored order, both ways
+    # Time Complexity: O(segment length)
+    def _sum(self, seg):
+        cities = np.array(self._cities[seg])
+        forward = np.zeros(len(cities))
+        backward = np.zeros(len(cities))
+        np.cumsum(self.costs[cities[:-1], cities[1:]], out=forward[1:])
+        np.cumsum(self.costs[cities[1:], cities[:-1]], out=backward[1:])
+        self._store(seg, forward.tolist(), backward.tolist())
+
+    def _store(self, seg, forward, backward):
+        cities = self._cities[seg]
+        self._forward[seg] = forward
+        self._backward[seg] = backward
+        self._summary[seg] = (cities[0], cities[-1], forward[-1], backward[-1], len(cities))
+
+    def _new_segment(self, cities, forward, backward):
+        seg = len(self._cities)
+        self._cities.append(cities)
+        self._reversed.append(False)
+        self._forward.append(None)
+        self._backward.append(None)
+        self._index(seg, 0, len(cities))
+        self._store(seg, forward, backward)
+        return seg
+
+    # Points the cities stored at [lo, hi) of the segment back at it
+    def _index(self, seg, lo, hi):
+        cities = self._cities[seg]
+        for i in range(lo, hi):
+            self._city_seg[cities[i]] = seg
+            self._city_idx[cities[i]] = i
+
+    # Time Complexity: O(number of segments)
+    def _renumber(self):
+        rank = np.empty(len(self._cities), dtype=np.int64)
+        rank[self._ring] = np.arange(len(self._ring))
+        self._rank = rank.tolist()
+        self._dirty = True
+
+    def _first(self, seg):
+        return self._cities[seg][-1 if self._reversed[seg] else 0]
+
+    def _last(self, seg):
+        return self._cities[seg][0 if self._reversed[seg] else -1]
+
+    # Where each segment starts, and the forward and backward cost from the start of
+    # the ring to its first city
+    # Time Complexity: O(number of segments)
+    def _refresh(self):
+        ring = np.array(self._ring)
+        flipped = np.array(self._reversed)[ring]
+        head, tail, stored_forward, stored_backward, length = self._summary[ring].T
+        head = head.astype(np.int64)
+        tail = tail.astype(np.int64)
+        firsts = np.where(flipped, tail, head)
+        lasts = np.where(flipped, head, tail)
+        following = np.roll(firsts, -1)
+        links = self._links[ring]
+        stale = np.flatnonzero((links[:, 0] != lasts) | (links[:, 1] != following))
+        for rank in stale.tolist():
+            a, b = lasts[rank], following[rank]
+            links[rank] = (a, b, self.costs[a, b], self.costs[b, a])
+        self._links[ring[stale]] = links[stale]
+        forward = np.cumsum(np.where(flipped, stored_backward, stored_forward) + links[:, 2])
+        backward = np.cumsum(np.where(flipped, stored_forward, stored_backward) + links[:, 3])
+        self._total_forward = float(forward[-1])
+        self._total_backward = float(backward[-1])
+        self._start = [0] + np.cumsum(length.astype(np.int64)).tolist()[:-1]
+        self._forward_to = [0.0] + forward.tolist()[:-1]
+        self._backward_to = [0.0] + backward.tolist()[:-1]
+        self._dirty = False
+
+    # Position in the tour and the forward and backward path costs from the start to city
+    def _prefix(self, city):
+        seg = self._city_seg[city]
+        i = self._city_idx[city]
+        rank = self._rank[seg]
+        forward = self._forward[seg]
+        backward = self._backward[seg]
+        if self._reversed[seg]:
+            return (self._start[rank] + len(forward) - 1 - i,
+                    self._forward_to[rank] + backward[-1] - backward[i],
+                    self._backward_to[rank] + forward[-1] - forward[i])
+        return self._start[rank] + i, self._forward_to[rank] + forward[i], self._backward_to[rank] + backward[i]
+
+    def next(self, city):
+        seg = self._city_seg[city]
+        cities = self._cities[seg]
+        i = self._city_idx[city] + (-1 if self._reversed[seg] else 1)
+        if 0 <= i < len(cities):
+            return cities[i]
+        return self._first(self._ring[(self._rank[seg] + 1) % len(self._ring)])
+
+    def prev(self, city):
+        seg = self._city_seg[city]
+        cities = self._cities[seg]
+        i = self._city_idx[city] + (1 if self._reversed[seg] else -1)
+        if 0 <= i < len(cities):
+            return cities[i]
+        return self._last(self._ring[self._rank[seg] - 1])
+
+    # (segment rank, index within the segment in tour direction) orders the cities
+    # without the O(sqrt(n)) refresh
+    def _key(self, city):
+        seg = self._city_seg[city]
+        i = self._city_idx[city]
+        return self._rank[seg], (len(self._cities[seg]) - 1 - i if self._reversed[seg] else i)
+
+    # True if b is visited on the way from a forward to c (inclusive)
+    def between(self, a, b, c):
+        a, b, c = self._key(a), self._key(b), self._key(c)
+        if a <= c:
+            return a <= b <= c
+        return b >= a or b <= c
+
+    # Number of steps forward from a to b
+    def distance(self, a, b):
+        if self._dirty:
+            self._refresh()
+        return (self._prefix(b)[0] - self._prefix(a)[0]) % self.n
+
+    # Cost of walking forward from b to c
+    def path_cost(self, b, c):
+        if self._dirty:
+            self._refresh()
+        i, forward_b, _ = self._prefix(b)
+        j, forward_c, _ = self._prefix(c)
+        if j < i:
+            forward_c += self._total_forward
+        return forward_c - forward_b
+
+    # Cost of walking the same path backwards, from c to b
+    def reversed_path_cost(self, b, c):
+        if self._dirty:
+            self._refresh()
+        i, _, backward_b = self._prefix(b)
+        j, _, backward_c = self._prefix(c)
+        if j < i:
+            backward_c += self._total_backward
+        return backward_c - backward_b
+
+    # Makes city the first of its segment by moving the cities before it into a segment of their own
+    # Time Complexity: O(segment length + number of segments)
+    def _split(self, city):
+        seg = self._city_seg[city]
+        cities = self._cities[seg]
+        i = self._city_idx[city]
+        forward = self._forward[seg]
+        backward = self._backward[seg]
+        flipped = self._reversed[seg]
+        if flipped:
+            # store the cities in tour order; walking them that way swaps the two sums
+            cities = cities[::-1]
+            i = len(cities) - 1 - i
+            forward, backward = ([backward[-1] - cost for cost in reversed(backward)],
+                                 [forward[-1] - cost for cost in reversed(forward)])
+        if i == 0:
+            return
+        self._cities[seg] = cities[:i]
+        self._reversed[seg] = False
+        if flipped:
+            self._index(seg, 0, i)
+        self._store(seg, forward[:i], backward[:i])
+        # the tail's sums are the same prefix sums, restarted from zero at city
+        tail = self._new_segment(cities[i:], [cost - forward[i] for cost in forward[i:]],
+                                 [cost - backward[i] for cost in backward[i:]])
+        self._ring.insert(self._rank[seg] + 1, tail)
+        self._renumber()
+
+    # Reverses the cities stored at [lo, hi) of one segment.  The edges inside now run
+    # the other way, so their costs are the old backward ones; only the two edges at
+    # the ends need looking up.
+    # Time Complexity: O(segment length)
+    def _reverse_within(self, seg, lo, hi):
+        cities = self._cities[seg]
+        forward = self._forward[seg]
+        backward = self._backward[seg]
+        ahead = [after - before for before, after in zip(forward, forward[1:])]
+        behind = [after - before for before, after in zip(backward, backward[1:])]
+        cities[lo:hi] = cities[lo:hi][::-1]
+        ahead[lo:hi - 1], behind[lo:hi - 1] = behind[lo:hi - 1][::-1], ahead[lo:hi - 1][::-1]
+        for edge in (lo - 1, hi - 1):
+            if 0 <= edge < len(cities) - 1:
+                ahead[edge] = self.costs[cities[edge], cities[edge + 1]]
+                behind[edge] = self.costs[cities[edge + 1], cities[edge]]
+        self._index(seg, lo, hi)
+        self._store(seg, [0.0] + list(itertools.accumulate(ahead)), [0.0] + list(itertools.accumulate(behind)))
+
+    # Reverses the path from b forward to c in place
+    # Time Complexity: O(sqrt(n)) amortized
+    def reverse(self, b, c):
+        if self.journal is not None:
+            self.journal.append((b, c))
+        self._dirty = True
+        seg = self._city_seg[b]
+        i = self._city_idx[b]
+        j = self._city_idx[c]
+        if seg == self._city_seg[c] and (i >= j if self._reversed[seg] else i <= j):
+            self._reverse_within(seg, min(i, j), max(i, j) + 1)
+            return
+
+        self._split(b)
+        self._split(self.next(c))
+        ring = self._ring
+        first = self._rank[self._city_seg[b]]
+        last = self._rank[self._city_seg[c]]
+        if last < first:
+            ring = ring[first:] + ring[:first]
+            last += len(ring) - first
+            first = 0
+        run = ring[first:last + 1]
+        run.reverse()
+        ring[first:last + 1] = run
+        for seg in run:
+            self._reversed[seg] = not self._reversed[seg]
+        self._ring = ring
+        if len(ring) > self._max_segments:
+            self._build(self.sequence())
+        else:
+            self._renumber()
+
+    # Call after changing entries of the cost matrix in place
+    # Time Complexity: O(n)
+    def invalidate(self):
+        for seg in self._ring:
+            self._sum(seg)
+        self._links[:] = -1.0
+        self._dirty = True
+
+    def sequence(self):
+        return np.array([city for seg in self._ring
+                         for city in (self._cities[seg][::-1] if self._reversed[seg] else self._cities[seg])],
+                        dtype=np.int64)
+
+    def cost(self):
+        if self._dirty:
+            self._refresh()
+        return self._total_forward
+
+
+# Tours below this many cities are cheaper to keep as plain arrays: numpy moves a few
+# thousand entries faster than the two-level list does its sqrt(n) Python steps
+TWO_LEVEL_THRESHOLD = 5000
+
+
+# ArrayTour for small instances, TwoLevelTour for large ones and for lazily computed
+# costs, where ArrayTour's O(n) refresh would recompute the whole tour's costs every move
+def make_tour(costs, order):
+    if len(order) >= TWO_LEVEL_THRESHOLD or not isinstance(costs, np.ndarray):
+        return TwoLevelTour(costs, order)
+    return ArrayTour(costs, order)
+
+
+''' <summary>
+	Candidate lists for neighbor-list local search: for every city its k cheapest
+	successors (out) and its k cheapest predecessors (in), each sorted by cost.
+	</summary>
+'''
+# Time Complexity: O(n^2 + n k log k)
+# Space Complexity: O(n k)
+def neighbor_lists(costs, k):
+    if not isinstance(costs, np.ndarray):
+        # a sparse scenario's LazyCostMatrix builds them from a grid instead
+        return costs.neighbor_lists(k)
+    n = costs.shape[0]
+    k = max(1, min(k, n - 1))
+
+    def cheapest(matrix):
+        nearest = np.argpartition(matrix, k, axis=1)[:, :k + 1] if k < n - 1 else np.tile(np.arange(n), (n, 1))
+        nearest_costs = np.take_along_axis(matrix, nearest, axis=1)
+        nearest = np.take_along_axis(nearest, np.argsort(nearest_costs, axis=1, kind='stable'), axis=1)
+        return [row[row != city][:k] for city, row in enumerate(nearest)]
+
+    return cheapest(costs), cheapest(costs.T)
+
+
+# Time Complexity: O(n^2) with numpy doing the inner loop
+# Space Complexity: O(n)
+def nearest_neighbor_tour(costs, start=0):
+    n = costs.shape[0]
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=np.int64)
+    city = start
+    for step in range(n):
+        order[step] = city
+        visited[city] = True
+        if step < n - 1:
+            row = np.where(visited, np.inf, costs[city])
+            city = int(np.argmin(row))
+    return order
+
+
+''' <summary>
+	Insertion constructors.  The tour starts as start and a partner city (its
+	nearest, or its farthest for 'farthest'), and the remaining cities are
+	inserted one at a time, each between the consecutive pair where it adds the
+	least cost.  The rule picks the next city: 'nearest' and 'farthest' take the
+	uninserted city closest to / farthest from the tour (by the cheaper direction
+	of its edges to tour cities), 'cheapest' the one with the cheapest insertion.
+	For every uninserted city the tour distance, the cheapest insertion cost and
+	the edge it goes into are kept in arrays and updated in one vectorized pass
+	per insertion against just the two new edges; only the cities whose best
+	edge was the one split have to be re-scanned against the whole tour.  Costs
+	are directional and missing edges are priced at INFEASIBLE_COST, so
+	asymmetric and thinned scenarios need nothing special.
+	</summary>
+'''
+# Time Complexity: O(n^2) (plus the re-scans, O(n) per city whose best edge was split)
+# Space Complexity: O(n)
+def insertion_tour(costs, rule='cheapest', start=0):
+    n = costs.shape[0]
+    if n <= 3:
+        return np.roll(np.arange(n), -start)
+    succ = np.full(n, -1, dtype=np.int64)
+    inserted = np.zeros(n, dtype=bool)
+    nodes = np.empty(n, dtype=np.int64)  # tour cities in the order they were inserted
+
+    distance = np.minimum(costs[start], costs[:, start]).astype(float)
+    if rule == 'farthest':
+        partner = int(np.argmax(np.where(np.arange(n) == start, -np.inf, distance)))
+    else:
+        partner = int(np.argmin(np.where(np.arange(n) == start, np.inf, distance)))
+    succ[start], succ[partner] = partner, start
+    inserted[[start, partner]] = True
+    nodes[:2] = start, partner
+    size = 2
+    distance = np.minimum(distance, np.minimum(costs[partner], costs[:, partner]))
+
+    def added(a, b):  # cost of putting every city between a and b
+        return costs[a] + costs[:, b] - costs[a, b]
+
+    best_cost = added(start, partner).astype(float)
+    best_at = np.full(n, start, dtype=np.int64)
+    other = added(partner, start)
+    better = other < best_cost
+    best_cost[better], best_at[better] = other[better], partner
+
+    for _ in range(n - 2):  # Time Complexity: O(n) iterations of O(n) each
+        if rule == 'cheapest':
+            city = int(np.argmin(np.where(inserted, np.inf, best_cost)))
+        elif rule == 'farthest':
+            city = int(np.argmax(np.where(inserted, -np.inf, distance)))
+        else:
+            city = int(np.argmin(np.where(inserted, np.inf, distance)))
+        a = best_at[city]
+        b = succ[a]
+        succ[a], succ[city] = city, b
+        inserted[city] = True
+        nodes[size] = city
+        size += 1
+        if rule != 'cheapest':
+            distance = np.minimum(distance, np.minimum(costs[city], costs[:, city]))
+
+        split = (best_at == a) & ~inserted  # their best edge a -> b is gone
+        for p, q in ((a, city), (city, b)):
+            cost = added(p, q)
+            better = cost < best_cost
+            best_cost[better], best_at[better] = cost[better], p
+        stale = np.flatnonzero(split)
+        if len(stale):
+            tails = nodes[:size]
+            heads = succ[tails]
+            options = costs[tails[:, None], stale] + costs[stale[:, None], heads].T - costs[tails, heads][:, None]
+            pick = np.argmin(options, axis=0)
+            best_cost[stale] = options[pick, np.arange(len(stale))]
+            best_at[stale] = tails[pick]
+
+    order = np.empty(n, dtype=np.int64)
+    city = start
+    for step in range(n):
+        order[step] = city
+        city = succ[city]
+    return order
+
+
+# Cities in the order a Hilbert curve over their bounding box visits them: a tour
+# within a constant factor of optimal on uniform points, with no cost lookups at all
+# Time Complexity: O(n log n)
+# Space Complexity: O(n)
+def hilbert_tour(xs, ys, bits=16):
+    side = 1 << bits
+
+    def scaled(values):
+        span = max(values.max() - values.min(), 1e-12)
+        return np.minimum(((values - values.min()) / span * side).astype(np.int64), side - 1)
+
+    x, y = scaled(np.asarray(xs)), scaled(np.asarray(ys))
+    d = np.zeros(len(x), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve inside it is in standard orientation
+        flip = ~ry & rx
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+    return np.argsort(d, kind='stable')
+
+
+# Nearest neighbor restricted to candidate lists: from each city go to its cheapest
+# unvisited candidate, or when they are all visited, to the first unvisited city of fallback
+# Time Complexity: O(n k)
+# Space Complexity: O(n)
+def candidate_tour(out_nbrs, fallback, start=0):
+    n = len(fallback)
+    fallback = fallback.tolist()
+    visited = [False] * n
+    visited[start] = True
+    order = [start]
+    city = start
+    cursor = 0
+    for _ in range(n - 1):
+        for city in out_nbrs[city].tolist():
+            if not visited[city]:
+                break
+        else:
+            while visited[fallback[cursor]]:
+                cursor += 1
+            city = fallback[cursor]
+        visited[city] = True
+        order.append(city)
+    return np.array(order, dtype=np.int64)
+
+
+# Starting tour for the improvement solvers, beginning at start: nearest neighbor on a
+# dense matrix, where its O(n^2) is affordable; otherwise nearest neighbor over the
+# candidate lists (if given) falling back on, or else simply, the Hilbert curve
+def initial_tour(costs, start=0, neighbors=None):
+    if isinstance(costs, np.ndarray):
+        return nearest_neighbor_tour(costs, start)
+    order = hilbert_tour(*costs.coordinates())
+    if neighbors is not None:
+        return candidate_tour(neighbors[0], order, start)
+    return np.roll(order, -int(np.flatnonzero(order == start)[0]))
+
+
+''' <summary>
+	Finds a tour that uses only existing edges, for heavily thinned scenarios
+	where nearest neighbor and random permutations keep running into missing
+	edges.  Depth-first search, trying at each step the unvisited successors
+	with the fewest ways left in first, and backtracking on dead ends.  Forward
+	checking prunes early: every step updates, for each city, how many
+	unvisited cities (or the path's end) can still enter it and how many it can
+	still leave to, in vectorized O(degree) work.  A step is undone at once if
+	it leaves an unvisited city (or the return to the start) with no way in or
+	out.  A successor whose only way in is the path's end must come next.
+	Chronological backtracking can get stuck deep in a hopeless subtree, so
+	after RESTART_STEPS * n undone steps the search restarts from another
+	start city, with ties broken at random and twice the patience each time.
+	The first attempt starts from the city with the fewest predecessors and
+	breaks ties cheapest first.  feasibility is a TSPClasses.FeasibilityIndex
+	(anything with its successors, predecessors, degrees and exists).
+	</summary>
+	<returns>the tour as an index array and the number of steps undone, or None
+	and that number if there is no tour or the deadline passed first</returns>
+'''
+# Time Complexity: O(n * degree) without backtracking; exponential at worst
+# Space Complexity: O(n * degree) for the stack of options
+def feasible_tour(feasibility, deadline, seed=None):
+    out_degree, in_degree = feasibility.degrees()
+    n = len(out_degree)
+    if n < 2:
+        return np.arange(n), 0
+    if not out_degree.all() or not in_degree.all():
+        return None, 0
+    rng = np.random.default_rng(seed)
+    start, rng_ties = int(np.argmin(in_degree)), None
+    patience = RESTART_STEPS * n
+    undone = 0
+    while True:
+        order, steps = _feasible_path(feasibility, deadline, start, in_degree, out_degree, rng_ties, patience)
+        undone += steps
+        if order is not None or steps < patience or deadline.expired():
+            return order, undone
+        start, rng_ties = int(rng.integers(n)), rng
+        patience *= 2
+
+
+# Undone steps per city before feasible_tour's first restart
+RESTART_STEPS = 20
+
+
+# One depth-first attempt of feasible_tour from start, giving up after patience undone steps
+def _feasible_path(feasibility, deadline, start, in_degree, out_degree, rng, patience):
+    n = len(in_degree)
+    ways_in, ways_out = in_degree.copy(), out_degree.copy()
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[start] = False
+
+    def options(city):
+        succ = feasibility.successors(city)
+        succ = succ[unvisited[succ]]
+        forced = succ[ways_in[succ] == 1]
+        if len(forced):
+            return forced[:1] if len(forced) == 1 else forced[:0]
+        key = ways_in[succ] if rng is None else ways_in[succ] + rng.random(len(succ))
+        return succ[np.argsort(key, kind='stable')]
+
+    # Moves the end of the path from city to nxt (sign 1) or back (sign -1); on the
+    # way forward, False if that strands somebody
+    def step(city, nxt, sign):
+        succ, pred = feasibility.successors(city), feasibility.predecessors(nxt)
+        ways_in[succ] -= sign
+        ways_out[pred] -= sign
+        unvisited[nxt] = sign < 0
+        if sign < 0:
+            return True
+        return not ((ways_in[succ] == 0) & unvisited[succ]).any() and \
+            not ((ways_out[pred] == 0) & unvisited[pred]).any() and ways_in[start] > 0
+
+    path = [start]
+    frames = [[options(start), 0]]
+    undone = 0
+    while frames and undone < patience:
+        if deadline.expired():
+            break
+        frame = frames[-1]
+        city = path[-1]
+        if frame[1] == len(frame[0]):
+            # every option from here failed: take back the step that led here
+            frames.pop()
+            if len(path) > 1:
+                path.pop()
+                step(path[-1], city, -1)
+                undone += 1
+            continue
+        nxt = int(frame[0][frame[1]])
+        frame[1] += 1
+        path.append(nxt)
+        if step(city, nxt, 1):
+            if len(path) == n:
+                if feasibility.exists(nxt, start):
+                    return np.array(path, dtype=np.int64), undone
+            else:
+                frames.append([options(nxt), 0])
+                continue
+        path.pop()
+        step(city, nxt, -1)
+        undone += 1
+    return None, undone
+
+
+# Splits the cities into groups of at most max_size by recursive median cuts across
+# the wider side of each group's bounding box (a k-d tree's leaves)
+# Time Complexity: O(n log(n / max_size))
+def kd_partition(xs, ys, max_size):
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    groups = []
+    pending = [np.arange(len(xs))]
+    while pending:
+        group = pending.pop()
+        if len(group) <= max_size:
+            groups.append(group)
+            continue
+        gx, gy = xs[group], ys[group]
+        values = gx if np.ptp(gx) >= np.ptp(gy) else gy
+        half = len(group) // 2
+        split = np.argpartition(values, half)
+        pending += [group[split[:half]], group[split[half:]]]
+    return groups
+
+
+''' <summary>
+	Joins two disjoint directed cycles of the successor array succ into one by
+	the cheapest exchange of an edge a1 -> a2 of the first for b1 -> b2 of the
+	second: a1 -> b2 and b1 -> a2 replace them.  Only the first cycle's cities
+	in a_cities and the second's in b_cities are tried, all pairs at once.
+	</summary>
+	<returns>the cost change of the join</returns>
+'''
+# Time Complexity: O(len(a_cities) * len(b_cities))
+def join_cycles(costs, succ, a_cities, b_cities):
+    a1, b1 = np.asarray(a_cities), np.asarray(b_cities)
+    a2, b2 = succ[a1], succ[b1]
+    change = (costs[a1[:, None], b2[None, :]] + costs[b1[None, :], a2[:, None]]
+              - costs[a1, a2][:, None] - costs[b1, b2][None, :])
+    i, j = np.unravel_index(np.argmin(change), change.shape)
+    succ[a1[i]], succ[b1[j]] = b2[j], a2[i]
+    return float(change[i, j])
+
+
+# Inserts city into the tour between the consecutive pair where it adds the least
+# cost; a missing edge costs INFEASIBLE_COST, so it only goes next to one if it must
+# Time Complexity: O(n), one vectorized pass over the tour edges
+def cheapest_insertion(costs, order, city):
+    order = np.asarray(order, dtype=np.int64)
+    if len(order) < 2:
+        return np.append(order, city)
+    succ = np.roll(order, -1)
+    added = costs[order, city] + costs[city, succ] - costs[order, succ]
+    return np.insert(order, int(np.argmin(added)) + 1, city)
+
+
+# Takes city out of the tour, joining its neighbors.  After Scenario.removeCity,
+# pass the index it returned as moved so that the city renumbered into the freed
+# index follows along.
+# Time Complexity: O(n)
+def delete_city(order, city, moved=None):
+    order = np.asarray(order, dtype=np.int64)
+    order = order[order != city]
+    if moved is not None:
+        order[order == moved] = city
+    return order
+
+
+''' <summary>
+	Local tour repair after scenario edits: each of cities is taken out of the
+	tour (if it is on it) and put back at its cheapest position, in turn.  Use
+	it for cities that were added or moved, or that an edge change left with a
+	missing tour edge; a few cities cost O(n) each, against O(n^2) or more for
+	solving again.  The result can be polished with local_search from the
+	repaired cities.
+	</summary>
+'''
+# Time Complexity: O(n) per city repaired
+def repair_tour(costs, order, cities):
+    order = np.asarray(order, dtype=np.int64)
+    cities = np.atleast_1d(np.asarray(cities, dtype=np.int64))
+    order = order[~np.isin(order, cities)]
+    for city in cities.tolist():
+        order = cheapest_insertion(costs, order, city)
+    return order
+
+
+# Moves the path s1..s2 (without reversing it) to between e and next(e), using
+# three reversals so it works on any tour type; picks whichever side is shorter
+# Time Complexity: O(length of the path plus the shorter side)
+def move_segment(tour, s1, s2, e):
+    p = tour.prev(s1)
+    q = tour.next(s2)
+    f = tour.next(e)
+    if tour.distance(q, e) <= tour.distance(f, p):
+        # p [s1..s2] [q..e] f  ->  p [q..e] [s1..s2] f
+        tour.reverse(s1, e)
+        tour.reverse(e, q)
+        tour.reverse(s2, s1)
+    else:
+        # e [f..p] [s1..s2] q  ->  e [s1..s2] [f..p] q
+        tour.reverse(f, s2)
+        tour.reverse(s2, s1)
+        tour.reverse(p, f)
+
+
+# Exchanges two non-adjacent cities, again with reversals
+# Time Complexity: O(n) worst case, half the tour at most
+def swap_cities(tour, u, v):
+    if tour.distance(u, v) > tour.n // 2:
+        u, v = v, u
+    # p u [q..r] v s  ->  p v [q..r] u s
+    tour.reverse(u, v)
+    tour.reverse(tour.next(v), tour.prev(u))
+
+
+MOVE_TWO_OPT = 0
+MOVE_OR_OPT = 1
+MOVE_SWAP = 2
+
+
+''' <summary>
+	Draws a random 2-opt, or-opt (a path of one to three cities moved elsewhere)
+	or swap move and returns it with its exact cost delta.  Every delta is O(1):
+	only the edges at the ends of the moved paths change, plus (for 2-opt) the
+	reversed path, whose cost comes from the tour's prefix sums.
+	</summary>
+	<returns>(delta, move) or None when the drawn move is degenerate</returns>
+'''
+def sample_move(tour, costs, rng):
+    n = tour.n
+    kind = rng.integers(3)
+    if kind == MOVE_TWO_OPT:
+        b, c = rng.integers(n, size=2)
+        a = tour.prev(b)
+        d = tour.next(c)
+        if b == c or d == b or c == a:
+            return None
+        delta = (costs[a, c] + costs[b, d] - costs[a, b] - costs[c, d]
+                 + tour.reversed_path_cost(b, c) - tour.path_cost(b, c))
+        return delta, (MOVE_TWO_OPT, b, c)
+    if kind == MOVE_OR_OPT:
+        s1, e = rng.integers(n, size=2)
+        s2 = s1
+        for _ in range(rng.integers(3)):
+            s2 = tour.next(s2)
+        p = tour.prev(s1)
+        q = tour.next(s2)
+        if tour.between(s1, e, s2) or e == p or q == p:
+            return None
+        f = tour.next(e)
+        delta = (costs[p, q] + costs[e, s1] + costs[s2, f]
+                 - costs[p, s1] - costs[s2, q] - costs[e, f])
+        return delta, (MOVE_OR_OPT, s1, s2, e)
+    u, v = rng.integers(n, size=2)
+    p, q = tour.prev(u), tour.next(u)
+    r, t = tour.prev(v), tour.next(v)
+    if u == v or v == q or v == p:
+        return None
+    delta = (costs[p, v] + costs[v, q] + costs[r, u] + costs[u, t]
+             - costs[p, u] - costs[u, q] - costs[r, v] - costs[v, t])
+    return delta, (MOVE_SWAP, u, v)
+
+
+def apply_move(tour, move):
+    if move[0] == MOVE_TWO_OPT:
+        tour.reverse(move[1], move[2])
+    elif move[0] == MOVE_OR_OPT:
+        move_segment(tour, move[1], move[2], move[3])
+    else:
+        swap_cities(tour, move[1], move[2])
+
+
+# Takes back every reversal recorded since tour.journal was set to [] and stops recording
+# Time Complexity: O(total length of the recorded reversals)
+def undo_journal(tour):
+    journal, tour.journal = tour.journal, None
+    for b, c in reversed(journal):
+        # reversing b..c left the path running from c to b
+        tour.reverse(c, b)
+
+
+def advance(tour, city, steps):
+    for _ in range(steps):
+        city = tour.next(city)
+    return city
+
+
+# Cuts the tour into four pieces A B C D and reconnects them as A C B D
+# Time Complexity: O(n)
+def double_bridge(order, rng):
+    n = len(order)
+    if n < 8:
+        return rng.permutation(order)
+    i, j, k = np.sort(rng.choice(np.arange(1, n), size=3, replace=False))
+    return np.concatenate((order[:i], order[j:k], order[i:j], order[k:]))
+
+
+# Tries every 2-opt move that adds an edge out of or into `city` with one of its
+# candidates; applies the first improving one and returns the cities whose edges
+# changed with the cost change, or None.
+# Time Complexity: O(k)
+def _improve_city_2opt(tour, costs, city, out_nbrs, in_nbrs, exists=None):
+    a = city
+    # New edge a -> c: reverse the path b..c, where b = next(a)
+    b = tour.next(a)
+    removed = costs[a, b]
+    for c in out_nbrs[a]:
+        added = costs[a, c]
+        if added >= removed:
+            break
+        if c == b:
+            continue
+        d = tour.next(c)
+        if exists is not None and not exists(b, d):
+            continue
+        delta = (added + costs[b, d] - removed - costs[c, d]
+                 + tour.reversed_path_cost(b, c) - tour.path_cost(b, c))
+        if delta < -IMPROVEMENT_EPSILON:
+            tour.reverse(b, c)
+            return (a, b, c, d), delta
+    # New edge c -> a: reverse the path c..b, where b = prev(a)
+    b = tour.prev(a)
+    removed = costs[b, a]
+    for c in in_nbrs[a]:
+        added = costs[c, a]
+        if added >= removed:
+            break
+        if c == b:
+            continue
+        d = tour.prev(c)
+        if exists is not None and not exists(d, b):
+            continue
+        delta = (costs[d, b] + added - costs[d, c] - removed
+                 + tour.reversed_path_cost(c, b) - tour.path_cost(c, b))
+        if delta < -IMPROVEMENT_EPSILON:
+            tour.reverse(c, b)
+            return (a, b, c, d), delta
+    return None
+
+
+# Tries moving the path of one to three cities starting at `city` (unreversed) to
+# between two cities where one of the new edges is a candidate edge; applies the
+# first improving move
+# Time Complexity: O(k)
+def _improve_city_or_opt(tour, costs, city, out_nbrs, in_nbrs, exists=None):
+    s1 = s2 = city
+    for _ in range(3):
+        p = tour.prev(s1)
+        q = tour.next(s2)
+        if q == p or tour.next(q) == p:
+            return None
+        if exists is not None and not exists(p, q):
+            s2 = q
+            continue
+        removal_gain = costs[p, s1] + costs[s2, q] - costs[p, q]
+        if removal_gain > IMPROVEMENT_EPSILON:
+            # New edge e -> s1
+            for e in in_nbrs[s1]:
+                added = costs[e, s1]
+                if added >= removal_gain:
+                    break
+                if e == p or tour.between(s1, e, s2):
+                    continue
+                f = tour.next(e)
+                if exists is not None and not exists(s2, f):
+                    continue
+                delta = added + costs[s2, f] - costs[e, f] - removal_gain
+                if delta < -IMPROVEMENT_EPSILON:
+                    move_segment(tour, s1, s2, e)
+                    return (p, q, e, f, s1, s2), delta
+            # New edge s2 -> f
+            for f in out_nbrs[s2]:
+                added = costs[s2, f]
+                if added >= removal_gain:
+                    break
+                e = tour.prev(f)
+                if e == p or f == q or tour.between(s1, f, s2) or tour.between(s1, e, s2):
+                    continue
+                if exists is not None and not exists(e, s1):
+                    continue
+                delta = costs[e, s1] + added - costs[e, f] - removal_gain
+                if delta < -IMPROVEMENT_EPSILON:
+                    move_segment(tour, s1, s2, e)
+                    return (p, q, e, f, s1, s2), delta
+        s2 = q
+    return None
+
+
+# Runs the improvers over a work queue of cities (don't-look bits); see two_opt_descent
+def _descend(tour, neighbors, deadline, active, improvers, exists=None):
+    if tour.n < 5:
+        return 0, 0.0, []
+    costs = tour.costs
+    out_nbrs, in_nbrs = neighbors
+    work = collections.deque(tour.sequence() if active is None else active)
+    queued = np.zeros(tour.n, dtype=bool)
+    queued[list(work)] = True
+    moves = 0
+    gain = 0.0
+    while work and not deadline.expired():
+        city = work.popleft()
+        queued[city] = False
+        for improve in improvers:
+            found = improve(tour, costs, city, out_nbrs, in_nbrs, exists)
+            if found is not None:
+                break
+        else:
+            continue
+        touched, delta = found
+        moves += 1
+        gain += delta
+        for other in touched:
+            if not queued[other]:
+                queued[other] = True
+                work.append(other)
+    return moves, gain, list(work)
+
+
+''' <summary>
+	Neighbor-list 2-opt with don't-look bits: only cities on the work queue are
+	examined, and a city goes back on the queue only when one of its tour edges
+	changes.  Starting with every city queued this is a full descent to a 2-opt
+	local optimum; starting with a few cities it re-optimizes just around them.
+	With exists (e.g. Scenario.getFeasibility().exists), a move whose new edges
+	include a missing one is skipped before any of its costs are looked up.
+	</summary>
+	<returns>number of improving moves applied, their total cost change, and the
+	cities still queued when the deadline expired (empty at a local optimum)</returns>
+'''
+# Time Complexity: O(k) per city examined, plus O(n) per applied move
+# Space Complexity: O(n)
+def two_opt_descent(tour, neighbors, deadline, active=None, exists=None):
+    return _descend(tour, neighbors, deadline, active, (_improve_city_2opt,), exists)
+
+
+# Same as two_opt_descent, with or-opt moves tried whenever 2-opt finds nothing for a city
+def local_search(tour, neighbors, deadline, active=None, exists=None):
+    return _descend(tour, neighbors, deadline, active, (_improve_city_2opt, _improve_city_or_opt), exists)
+
+
+# Largest window optimize_windows accepts: its tables hold 2^k k entries per window
+MAX_WINDOW = 14
+
+
+''' <summary>
+	Exact reordering of tour windows: for each window of k consecutive cities
+	(starting at the given positions of order, and not overlapping), the
+	cheapest path from the city before the window through all k of its cities
+	to the city after it, by a Held-Karp bitmask DP.  All the windows are
+	solved together, one vectorized step per subset size: the table for the
+	subsets of s + 1 cities is filled from the one for s cities, for every
+	window, subset and last city at once.  Windows whose best path is cheaper
+	are rewritten in place.
+	</summary>
+	<returns>the total cost saved and the number of windows reordered</returns>
+'''
+# Time Complexity: O(w 2^k k^2) for w windows
+# Space Complexity: O(w 2^k k)
+def optimize_windows(costs, order, starts, k):
+    n = len(order)
+    full = (1 << k) - 1
+    bits = 1 << np.arange(k)
+    positions = (np.asarray(starts)[:, None] + np.arange(-1, k + 1)) % n
+    ends = order[positions]
+    before, inside, after = ends[:, 0], ends[:, 1:-1], ends[:, -1]
+    nwindows = len(before)
+    step = costs[inside[:, :, None], inside[:, None, :]]  # step[w, i, j]: i then j
+    enter = costs[before[:, None], inside]
+    leave = costs[inside, after[:, None]]
+    current = enter[:, 0] + step[:, np.arange(k - 1), np.arange(1, k)].sum(axis=1) + leave[:, -1]
+
+    # best[w, subset, j]: cheapest path from before through subset ending at its city j
+    best = np.full((nwindows, 1 << k, k), np.inf)
+    came_from = np.zeros((nwindows, 1 << k, k), dtype=np.int8)
+    best[:, bits, np.arange(k)] = enter
+    popcount = np.array([bin(subset).count('1') for subset in range(1 << k)])
+    step_into = step.transpose(0, 2, 1)[:, None]  # step_into[w, 0, j, i] = step[w, i, j]
+    for size in range(2, k + 1):
+        subsets = np.flatnonzero(popcount == size)
+        without = subsets[:, None] ^ bits  # the subset minus city j (or plus it, if j is not in it)
+        paths = best[:, without, :] + step_into
+        last = paths.argmin(axis=3)
+        cheapest = np.take_along_axis(paths, last[..., None], axis=3)[..., 0]
+        absent = (subsets[:, None] & bits) == 0
+        best[:, subsets, :] = np.where(absent, np.inf, cheapest)
+        came_from[:, subsets, :] = last
+
+    total = best[:, full, :] + leave
+    finish = total.argmin(axis=1)
+    optimal = total[np.arange(nwindows), finish]
+    saved = 0.0
+    improved = np.flatnonzero(optimal < current - IMPROVEMENT_EPSILON)
+    for w in improved.tolist():
+        path = []
+        subset, city = full, int(finish[w])
+        while subset:
+            path.append(city)
+            subset, city = subset ^ (1 << city), int(came_from[w, subset, city])
+        order[positions[w, 1:-1]] = inside[w, path[::-1]]
+        saved += float(current[w] - optimal[w])
+    return saved, len(improved)
+
+
+''' <summary>
+	Sliding-window polish: sweeps windows of k cities along the tour with
+	optimize_windows, each sweep a batch of back-to-back windows (so they do not
+	overlap; neighboring windows share only their fixed end cities) shifted by
+	about a third of a window from the last, until a full cycle of shifts finds
+	nothing or the deadline passes.  Windows are solved batch_size at a time to
+	bound the DP tables.  Complements local_search: it finds reorderings of
+	several consecutive cities that no single 2-opt or or-opt move reaches.
+	</summary>
+	<returns>number of windows reordered, total cost saved and the shift to
+	resume from</returns>
+'''
+# Time Complexity: O(n 2^k k^2) per sweep
+def window_polish(costs, order, k, deadline, batch_size=None, shift=0):
+    n = len(order)
+    k = min(k, MAX_WINDOW, n - 2)
+    if k < 3:
+        return 0, 0.0, shift
+    batch_size = batch_size or max(1, 2**20 // ((1 << k) * k))
+    stride = max(1, (k + 1) // 3)
+    reordered = 0
+    saved = 0.0
+    idle = 0
+    while idle * stride < k + 1 and not deadline.expired():
+        starts = np.arange(shift, shift + n - k - 1, k + 1) % n
+        found = 0
+        for batch in range(0, len(starts), batch_size):
+            if deadline.expired():
+                break
+            gain, count = optimize_windows(costs, order, starts[batch:batch + batch_size], k)
+            saved += gain
+            found += count
+        reordered += found
+        idle = 0 if found else idle + 1
+        shift = (shift + stride) % n
+    return reordered, saved, shift
+
+
+# Order crossover (OX): a random slice of p1 keeps its positions and the remaining
+# cities fill the other positions in the order they appear in p2
+# Time Complexity: O(n)
+def order_crossover(p1, p2, rng):
+    n = len(p1)
+    i, j = np.sort(rng.choice(n + 1, size=2, replace=False))
+    taken = np.zeros(n, dtype=bool)
+    taken[p1[i:j]] = True
+    rest = p2[~taken[p2]]
+    return np.concatenate((rest[:i], p1[i:j], rest[i:]))
+
+
+# Directed edge recombination: walks from city to city preferring a successor that
+# both parents share, then the cheaper parent successor, and only falls back to the
+# cheapest unvisited city when both are used up.  Parent successors that are
+# missing edges are never taken, so on thinned scenarios the child only gets a
+# missing edge when no unvisited city is reachable at all.
+# Time Complexity: O(n) plus O(n) per fallback
+def edge_recombination(costs, p1, p2, rng, infeasible_cost=np.inf):
+    n = len(p1)
+    succ1, succ2 = successors(p1), successors(p2)
+    visited = np.zeros(n, dtype=bool)
+    child = np.empty(n, dtype=np.int64)
+    city = p1[rng.integers(n)]
+    for step in range(n):
+        child[step] = city
+        visited[city] = True
+        if step == n - 1:
+            break
+        options = [c for c in {succ1[city], succ2[city]}
+                   if not visited[c] and costs[city, c] < infeasible_cost]
+        if options:
+            city = min(options, key=lambda c: costs[city, c])
+        else:
+            city = int(np.argmin(np.where(visited, np.inf, costs[city])))
+    return child
+
+
+''' <summary>
+	Generalized partition crossover (GPX).  Deleting the edges both parents
+	share leaves the graph of the edges they differ on, which falls apart into
+	connected components.  Every edge crossing between components is a shared
+	one, so both parents run through a component on the same number of paths.
+	When those paths join the same pairs of end cities in both parents (always
+	so for a component crossed into only once), the child can take either
+	parent's paths through the component independently of the other
+	components, and it takes the cheaper.  The remaining components are taken
+	together from whichever parent is cheaper on them.  The child is therefore
+	never costlier than the better parent.  With symmetric costs, edges count as
+	shared whichever way the parents run them, which leaves far more, smaller
+	components; the child's paths may then run either way.
+	</summary>
+	<returns>the child as an index array starting from p1's first city, and the
+	number of components it was recombined on independently</returns>
+'''
+# Time Complexity: O(n) plus O(d log n) for d differing edges
+# Space Complexity: O(n)
+def partition_crossover(costs, p1, p2, symmetric=False):
+    p1, p2 = np.asarray(p1), np.asarray(p2)
+    n = len(p1)
+    cities = np.arange(n)
+    succ1, succ2 = successors(p1), successors(p2)
+    pred1, pred2 = np.empty(n, dtype=np.int64), np.empty(n, dtype=np.int64)
+    pred1[succ1], pred2[succ2] = cities, cities
+    differ1, differ2 = succ1 != succ2, succ1 != succ2
+    if symmetric:
+        differ1 &= succ1 != pred2
+        differ2 &= succ2 != pred1
+    if not differ1.any():
+        return p1.copy(), 0
+
+    # Components of the differing edges (union-find, roots at the smaller index)
+    parent = list(range(n))
+
+    def root(city):
+        while parent[city] != city:
+            parent[city] = parent[parent[city]]
+            city = parent[city]
+        return city
+
+    for src, dst in itertools.chain(zip(np.flatnonzero(differ1).tolist(), succ1[differ1].tolist()),
+                                    zip(np.flatnonzero(differ2).tolist(), succ2[differ2].tolist())):
+        a, b = root(src), root(dst)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    label = np.array([root(city) for city in range(n)])
+
+    # Each parent's cost on the paths inside each component
+    inside1, inside2 = label == label[succ1], label == label[succ2]
+    cost1 = np.bincount(label[inside1], weights=costs[cities[inside1], succ1[inside1]], minlength=n)
+    cost2 = np.bincount(label[inside2], weights=costs[cities[inside2], succ2[inside2]], minlength=n)
+
+    involved = np.zeros(n, dtype=bool)
+    involved[label[differ1]] = True
+    paths1, paths2 = _component_paths(p1, label, symmetric), _component_paths(p2, label, symmetric)
+    if paths1 is None:
+        fused = involved  # one component holds every city
+    else:
+        fused = np.zeros(n, dtype=bool)
+        fused[paths1[np.any(paths1 != paths2, axis=1), 0]] = True
+        fused &= involved
+    use2 = involved & (cost2 < cost1)
+    use2[fused] = cost2[fused].sum() < cost1[fused].sum()
+    recombined = int(np.count_nonzero(involved & ~fused))
+    take2 = use2[label]
+    if not symmetric:
+        return successor_order(np.where(take2, succ2, succ1), p1[0]), recombined
+
+    # Undirected: walk the chosen neighbors, leaving each city by the one we did not come from
+    ahead, behind = np.where(take2, succ2, succ1).tolist(), np.where(take2, pred2, pred1).tolist()
+    order = np.empty(n, dtype=np.int64)
+    previous, city = -1, int(p1[0])
+    for step in range(n):
+        order[step] = city
+        previous, city = city, ahead[city] if ahead[city] != previous else behind[city]
+    return order, recombined
+
+
+# Every maximal run of the tour within one component, as rows (component, first city,
+# last city) sorted so two parents' rows line up; None if the tour never leaves one
+# Time Complexity: O(n log n)
+def _component_paths(order, label, symmetric):
+    labels = label[order]
+    starts = np.flatnonzero(labels != np.roll(labels, 1))
+    if len(starts) == 0:
+        return None
+    ends = np.roll(starts, -1) - 1
+    first, last = order[starts], order[ends]
+    if symmetric:
+        first, last = np.minimum(first, last), np.maximum(first, last)
+    paths = np.column_stack((labels[starts], first, last))
+    return paths[np.lexsort(paths.T[::-1])]
+
+
+''' <summary>
+	Tour merging: folds a set of tours (local optima, say) into one by
+	partition crossover, the cheapest tour first and then each other tour in
+	turn with the merged tour so far, repeating the pass while it still gains.
+	</summary>
+	<returns>the merged tour as an index array and its cost, which is at most
+	the cheapest input tour's</returns>
+'''
+# Time Complexity: O(m n log n) per pass over m tours
+def merge_tours(costs, tours, symmetric=False):
+    tours = [np.asarray(tour) for tour in tours]
+    tour_costs = [tour_cost(costs, tour) for tour in tours]
+    merged = tours[int(np.argmin(tour_costs))]
+    merged_cost = min(tour_costs)
+    while True:
+        start_cost = merged_cost
+        for tour in tours:
+            merged, _ = partition_crossover(costs, merged, tour, symmetric)
+        merged_cost = tour_cost(costs, merged)
+        if merged_cost >= start_cost - IMPROVEMENT_EPSILON:
+            return merged, merged_cost
@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+
+import asyncio
+import collections
+import math
+import time
+import numpy as np
+from TSPClasses import *
+from TSPLocalSearch import IMPROVEMENT_EPSILON
+
+
+''' <summary>
+	Online TSP for cities that arrive one at a time.  The tour is a doubly linked
+	list (successor and predecessor per city), so it is valid after every
+	arrival and inserting or relocating a city is O(1).  A uniform grid over
+	the cities finds the k nearest existing cities of a new one, and the new
+	city goes into the cheapest of the tour edges at those cities.  Between
+	arrivals, repair() relocates cities (or-opt) from a work queue of the
+	cities whose tour edges changed, within a time or move budget, so the
+	latency per arrival is bounded by O(k) plus that budget and does not grow
+	with the number of cities.  Costs are City.costTo's for the difficulty (all
+	edges exist unless edge_exists(src, dst) says otherwise).
+	</summary>
+'''
+class OnlineTour:
+    # Average cities per grid cell above which the grid is rebuilt with smaller cells
+    MAX_CELL_LOAD = 4
+
+    def __init__(self, difficulty='Easy', neighbors=8, cell_size=0.1, edge_exists=None):
+        self.difficulty = difficulty
+        self.neighbors = neighbors
+        self.edge_exists = edge_exists
+        self._points = []
+        self._succ = []
+        self._pred = []
+        self._cell_size = cell_size
+        self._grid = collections.defaultdict(list)
+        self._bounds = None  # min and max cell coordinates in use
+        self._refined_at = 0
+        self._work = collections.deque()
+        self._queued = []
+        self._cost = 0.0
+
+    def __len__(self):
+        return len(self._points)
+
+    # The same arithmetic as City.costTo, with missing edges at Scenario.INFEASIBLE_COST
+    # (the self-edge of a one-city tour costs nothing)
+    def cost_between(self, src, dst):
+        if src == dst:
+            return 0.0
+        if self.edge_exists is not None and not self.edge_exists(src, dst):
+            return Scenario.INFEASIBLE_COST
+        x1, y1, z1 = self._points[src]
+        x2, y2, z2 = self._points[dst]
+        cost = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
+        if not self.difficulty == 'Easy':
+            cost = max(cost + (z2 - z1), 0.0)
+        return float(math.ceil(cost * City.MAP_SCALE))
+
+    def cost(self):
+        return self._cost
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self._cell_size)), int(math.floor(y / self._cell_size))
+
+    def _bucket(self, city):
+        x, y, _ = self._points[city]
+        gx, gy = self._cell(x, y)
+        self._grid[gx, gy].append(city)
+        if self._bounds is None:
+            self._bounds = [gx, gx, gy, gy]
+        else:
+            bounds = self._bounds
+            bounds[:] = min(bounds[0], gx), max(bounds[1], gx), min(bounds[2], gy), max(bounds[3], gy)
+
+    # Halves the cell size and re-buckets every city; done at most once per doubling of
+    # the number of cities, so it is amortized O(1) per arrival even for clustered cities
+    # Time Complexity: O(n)
+    def _refine_grid(self):
+        self._cell_size /= 2.0
+        self._grid = collections.defaultdict(list)
+        self._bounds = None
+        for city in range(len(self._points)):
+            self._bucket(city)
+        self._refined_at = len(self._points)
+
+    ''' <summary>
+		Up to k cities nearest to (x, y), searching rings of grid cells outward
+		until k are found and no unsearched cell can hold a nearer one.  When the
+		rings would cover more cells than there are occupied ones, it scans all
+		the cities instead.
+		</summary>
+	'''
+    # Time Complexity: O(k) cells and cities for evenly spread cities, O(n) at worst
+    def nearest(self, x, y, k, exclude=None):
+        cx, cy = self._cell(x, y)
+        found = []
+        ring = 0
+        while True:
+            if (2 * ring + 1)**2 > 4 * len(self._grid) + 16:
+                # far from everything (or the cells got tiny): a plain scan is cheaper
+                found = [((px - x)**2 + (py - y)**2, city) for city, (px, py, _) in enumerate(self._points)
+                         if city != exclude]
+                break
+            for gx in range(cx - ring, cx + ring + 1):
+                edge = gx in (cx - ring, cx + ring)
+                for gy in (range(cy - ring, cy + ring + 1) if edge else (cy - ring, cy + ring)):
+                    for city in self._grid.get((gx, gy), ()):
+                        if city != exclude:
+                            px, py, _ = self._points[city]
+                            found.append(((px - x)**2 + (py - y)**2, city))
+            # everything within ring cells of the cell has been seen
+            reach = ring * self._cell_size
+            if len(found) >= k and sorted(found)[k - 1][0] <= reach * reach:
+                break
+            bounds = self._bounds
+            if bounds is None or ring >= max(cx - bounds[0], bounds[1] - cx, cy - bounds[2], bounds[3] - cy):
+                break
+            ring += 1
+        found.sort()
+        return [city for _, city in found[:k]]
+
+    # Cost added by putting city between a and succ[a]
+    def _insertion_cost(self, city, a):
+        b = self._succ[a]
+        return self.cost_between(a, city) + self.cost_between(city, b) - self.cost_between(a, b)
+
+    # Cheapest tour edge (given by its first city) next to one of the k nearest cities;
+    # if all of those need a missing edge, every edge of the tour is tried
+    def _best_edge(self, city, candidates):
+        options = set(candidates) | {self._pred[c] for c in candidates}
+        options.discard(city)
+        best = min(options, key=lambda a: self._insertion_cost(city, a))
+        if self._insertion_cost(city, best) >= Scenario.INFEASIBLE_COST / 2:
+            others = [a for a in range(len(self._points)) if a != city and self._succ[a] != -1]
+            best = min(others, key=lambda a: self._insertion_cost(city, a))
+        return best
+
+    def _link(self, city, a):
+        b = self._succ[a]
+        self._cost += self._insertion_cost(city, a)
+        self._succ[a], self._pred[city] = city, a
+        self._succ[city], self._pred[b] = b, city
+
+    # Cost saved by taking city out of the tour
+    def _removal_saving(self, city):
+        a, b = self._pred[city], self._succ[city]
+        return self.cost_between(a, city) + self.cost_between(city, b) - self.cost_between(a, b)
+
+    def _unlink(self, city):
+        a, b = self._pred[city], self._succ[city]
+        self._cost -= self._removal_saving(city)
+        self._succ[a], self._pred[b] = b, a
+        self._succ[city] = self._pred[city] = -1
+        return a, b
+
+    def _enqueue(self, *cities):
+        for city in cities:
+            if not self._queued[city]:
+                self._queued[city] = True
+                self._work.append(city)
+
+    ''' <summary>
+		Adds a city at (x, y) with the given elevation and inserts it into the
+		tour at the cheapest feasible position next to one of its nearest
+		cities.  The city and its new tour neighbors are queued for repair().
+		</summary>
+		<returns>the new city's index</returns>
+	'''
+    # Time Complexity: O(k), plus an occasional O(n) grid rebuild
+    def add(self, x, y, elevation=0.0):
+        city = len(self._points)
+        self._points.append((float(x), float(y), float(elevation)))
+        self._succ.append(-1)
+        self._pred.append(-1)
+        self._queued.append(False)
+        if city == 0:
+            self._succ[0] = self._pred[0] = 0
+        else:
+            self._link(city, self._best_edge(city, self.nearest(x, y, self.neighbors, exclude=city)))
+            self._enqueue(self._pred[city], city, self._succ[city])
+        self._bucket(city)
+        crowded = len(self._points) > self.MAX_CELL_LOAD * len(self._grid)
+        if crowded and len(self._points) >= 2 * self._refined_at:
+            self._refine_grid()
+        return city
+
+    ''' <summary>
+		Or-opt repair: takes cities off the work queue and moves each to the
+		cheapest edge next to its nearest cities when that shortens the tour,
+		queueing the cities whose edges the move changed.  Stops when the queue
+		is empty, after max_moves cities, or after time_budget seconds.
+		</summary>
+		<returns>number of improving moves made</returns>
+	'''
+    # Time Complexity: O(k) per city examined
+    def repair(self, time_budget=None, max_moves=None):
+        end_time = None if time_budget is None else time.monotonic() + time_budget
+        examined = 0
+        moves = 0
+        while self._work and len(self._points) >= 4:
+            if max_moves is not None and examined >= max_moves:
+                break
+            if end_time is not None and time.monotonic() >= end_time:
+                break
+            city = self._work.popleft()
+            self._queued[city] = False
+            examined += 1
+            a, b = self._pred[city], self._succ[city]
+            x, y, _ = self._points[city]
+            candidates = self.nearest(x, y, self.neighbors, exclude=city)
+            options = (set(candidates) | {self._pred[c] for c in candidates}) - {city, a}
+            if not options:
+                continue
+            target = min(options, key=lambda e: self._insertion_cost(city, e))
+            if self._insertion_cost(city, target) < self._removal_saving(city) - IMPROVEMENT_EPSILON:
+                self._unlink(city)
+                self._link(city, target)
+                moves += 1
+                self._enqueue(a, b, self._pred[city], city, self._succ[city])
+        return moves
+
+    # The current tour as an index array, starting from city 0
+    # Time Complexity: O(n)
+    def order(self):
+        order = np.empty(len(self._points), dtype=np.int64)
+        city = 0
+        for step in range(len(self._points)):
+            order[step] = city
+            city = self._succ[city]
+        return order
+
+    # A Scenario of the cities so far, e.g. to improve order() with the usual solvers, with
+    # the edges edge_exists rules out removed (asking it about every pair, so O(n^2))
+    def scenario(self):
+        removed = None
+        if self.edge_exists is not None:
+            ncities = len(self._points)
+            indptr = np.zeros(ncities + 1, dtype=np.int64)
+            indices = []
+            for src in range(ncities):
+                indices.extend(dst for dst in range(ncities) if dst != src and not self.edge_exists(src, dst))
+                indptr[src + 1] = len(indices)
+            removed = (indptr, np.array(indices, dtype=np.int32))
+        return Scenario.fromArrays(np.array(self._points, dtype=float).reshape(-1, 3), self.difficulty, removed)
+
+    ''' <summary>
+		Adds the cities of an iterable of (x, y) or (x, y, elevation) tuples as
+		they arrive, repairing for up to repair_time seconds after each.
+		</summary>
+		<returns>generator of the index each city got, yielded once it is in the
+		tour</returns>
+	'''
+    def consume(self, cities, repair_time=0.002):
+        for point in cities:
+            city = self.add(*point)
+            self.repair(repair_time)
+            yield city
+
+    ''' <summary>
+		consume() for an asyncio.Queue of points, ending at a None item.  While
+		the queue is empty, the waiting time is spent repairing, repair_time
+		seconds at a time.
+		</summary>
+	'''
+    async def consume_async(self, queue, repair_time=0.002):
+        while True:
+            while queue.empty() and self._work:
+                self.repair(repair_time)
+                await asyncio.sleep(0)
+            point = await queue.get()
+            if point is None:
+                return
+            self.add(*point)
+            self.repair(repair_time)
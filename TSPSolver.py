@@ -10,17 +10,341 @@ else:
 import time
 import numpy as np
 from TSPClasses import *
+from TSPLocalSearch import *
+import collections
 import heapq
 import itertools
+import contextlib
+import functools
+import inspect
+import multiprocessing
+import os
+import queue
+import threading
+
+
+''' <summary>
+	Collects every improved BSSF found during a solve and hands it to a callback,
+	at most once every min_interval seconds.  Improvements that arrive inside the
+	throttle window are held back and the latest one is delivered by poll() once
+	the window has closed (the solve's Deadline polls it whenever it reads the
+	clock) or when the solve finishes, so the callback never misses the final
+	tour.  If target_cost is given, the reporter tells the solver to stop as
+	soon as a tour at least that good has been found.
+	</summary>
+	<callback>called with a dictionary holding the same 'cost', 'time', 'count'
+	and 'soln' fields as the solver results</callback>
+'''
+class ProgressReporter:
+    def __init__(self, callback=None, min_interval=0.25, target_cost=None):
+        self.callback = callback
+        self.min_interval = min_interval
+        self.target_cost = target_cost
+        self.begin()
+
+    def begin(self):
+        self._start_time = time.monotonic()
+        self._last_emit = -math.inf
+        self._pending = None
+        self.best_cost = math.inf
+        self.target_reached = False
+
+    # Returns True once the quality target has been reached
+    def improved(self, soln, count=None):
+        if soln is None or not soln.cost < self.best_cost:
+            return self.target_reached
+        now = time.monotonic()
+        self.best_cost = soln.cost
+        self._pending = {'cost': soln.cost, 'time': now - self._start_time, 'count': count, 'soln': soln}
+        if self.target_cost is not None and soln.cost <= self.target_cost:
+            self.target_reached = True
+        if self.target_reached or now - self._last_emit >= self.min_interval:
+            self._emit(now)
+        return self.target_reached
+
+    # Delivers a held-back improvement once min_interval has passed since the last one
+    def poll(self, now=None):
+        if self._pending is not None:
+            now = time.monotonic() if now is None else now
+            if now - self._last_emit >= self.min_interval:
+                self._emit(now)
+
+    def finish(self):
+        if self._pending is not None:
+            self._emit(time.monotonic())
+
+    def _emit(self, now):
+        update = self._pending
+        self._pending = None
+        self._last_emit = now
+        if self.callback is not None:
+            self.callback(update)
+
+
+''' <summary>
+	Time budget plus cooperative cancellation shared by every solver.  It is built
+	on time.monotonic, so it cannot be fooled by wall-clock adjustments, and
+	expired() is cheap enough to call from inner loops: it only reads the clock
+	every few calls, adapting that stride so the clock is read roughly every
+	CHECK_INTERVAL seconds.  A solver therefore overruns its budget by about
+	CHECK_INTERVAL plus the cost of one loop iteration at most.
+	Child deadlines (for nested solves) never outlive their parent and share its
+	cancel event, so cancelling the outermost solve stops all of them.  If poll
+	is given (a ProgressReporter's), it is called with the time on every clock
+	read, by the children as well.
+	</summary>
+'''
+class Deadline:
+    CHECK_INTERVAL = 0.005
+    MAX_STRIDE = 1024
+
+    def __init__(self, time_allowance, cancel_event=None, parent=None, poll=None):
+        self._start = time.monotonic()
+        self._end = self._start + time_allowance
+        self._poll = poll
+        if parent is not None:
+            self._end = min(self._end, parent._end)
+            self._poll = parent._poll
+        self._cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self._expired = False
+        self._stride = 1
+        self._countdown = 1
+        self._last_check = self._start
+
+    def child(self, time_allowance):
+        return Deadline(time_allowance, self._cancel_event, self)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def expired(self):
+        if self._expired:
+            return True
+        self._countdown -= 1
+        if self._countdown > 0:
+            return False
+        now = time.monotonic()
+        if self._poll is not None:
+            self._poll(now)
+        if now >= self._end or self._cancel_event.is_set():
+            self._expired = True
+            return True
+        gap = now - self._last_check
+        if gap < self.CHECK_INTERVAL / 2:
+            self._stride = min(2 * self._stride, self.MAX_STRIDE)
+        elif gap > self.CHECK_INTERVAL:
+            self._stride = max(1, self._stride // 2)
+        self._last_check = now
+        self._countdown = self._stride
+        return False
+
+    def elapsed(self):
+        return time.monotonic() - self._start
+
+    def remaining(self):
+        return max(0.0, self._end - time.monotonic())
+
+
+''' <summary>
+	Decorator for solver entry points (anything taking a time_allowance).  Each
+	call runs under its own Deadline, a child of the caller's deadline when solvers
+	are nested, available to the solver as self._deadline.  The outermost entry
+	point of a solve also resets the cancel flag and the progress reporter before
+	running and flushes any throttled BSSF afterwards, so nested calls (e.g. fancy
+	calling greedy) all report into the same stream.
+	</summary>
+'''
+def anytime(solver_method):
+    signature = inspect.signature(solver_method)
+
+    @functools.wraps(solver_method)
+    def wrapper(self, *args, **kwargs):
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
+        time_allowance = arguments.arguments['time_allowance']
+        parent = self._deadline
+        outermost = parent is None
+        if outermost:
+            self._cancel_event.clear()
+            self._reporter.begin()
+            self._deadline = Deadline(time_allowance, self._cancel_event, poll=self._reporter.poll)
+        else:
+            self._deadline = parent.child(time_allowance)
+        try:
+            if outermost and self._result_cache is not None:
+                return self._solveCached(solver_method, arguments)
+            return solver_method(self, *args, **kwargs)
+        finally:
+            self._deadline = parent
+            if outermost:
+                self._reporter.finish()
+    return wrapper
 
 
 class TSPSolver:
     def __init__(self, gui_view):
         self._scenario = None
+        self._reporter = ProgressReporter()
+        self._deadline = None
+        self._cancel_event = threading.Event()
+        self._result_cache = None
 
     def setupWithScenario(self, scenario):
         self._scenario = scenario
 
+    ''' <summary>
+		Streams every improved BSSF of the following solves to callback (see
+		ProgressReporter).  Pass None to turn streaming off again.
+		</summary>
+	'''
+    def setProgressCallback(self, callback, min_interval=0.25, target_cost=None):
+        self._reporter = ProgressReporter(callback, min_interval, target_cost)
+
+    ''' <summary>
+		Puts a TSPCache.ResultCache in front of the entry points (None removes it).
+		A solve repeated with the same scenario, algorithm and parameters returns
+		the cached result at once if it was found with at least the requested time
+		allowance, or if the solver reported it 'converged' (more time would not
+		change its answer; the time-sliced searches never do).  Given a larger
+		allowance, a solver that takes an initial tour instead resumes from the
+		cached tour (and its search state, while the entry is in memory) for just
+		the extra time.  Results from the cache carry 'cached': 'hit' or 'warm';
+		cancelled solves are not stored.
+		</summary>
+	'''
+    def setResultCache(self, cache):
+        self._result_cache = cache
+
+    # Runs an @anytime entry point through the result cache (see setResultCache)
+    def _solveCached(self, solver_method, arguments):
+        params = {name: value for name, value in arguments.arguments.items()
+                  if name not in ('self', 'time_allowance', 'initial', 'state')}
+        plain = all(value is None or isinstance(value, (bool, int, float, str)) for value in params.values())
+        resumed = arguments.arguments.get('initial') is not None or arguments.arguments.get('state') is not None
+        if not plain or resumed:
+            return solver_method(*arguments.args, **arguments.kwargs)
+        cache = self._result_cache
+        time_allowance = arguments.arguments['time_allowance']
+        key = cache.key(self._scenario, solver_method.__name__, params)
+        entry = cache.get(key)
+
+        if entry is not None and (entry['complete'] or entry['budget'] >= time_allowance):
+            cities = self._scenario.getCities()
+            results = dict(entry['results'])
+            results['soln'] = TSPSolution([cities[i] for i in entry['order']])
+            results['time'] = self._deadline.elapsed()
+            results['cached'] = 'hit'
+            if entry.get('state') is not None:
+                results['state'] = entry['state']
+            self._reportSolution(results['soln'])
+            return results
+        warm = entry is not None and 'initial' in arguments.arguments
+        if warm:
+            if entry.get('state') is not None and 'state' in arguments.arguments:
+                arguments.arguments['state'] = entry['state']  # carries its own tour
+            else:
+                arguments.arguments['initial'] = entry['order']
+            arguments.arguments['time_allowance'] = time_allowance - entry['budget']
+            self._deadline = Deadline(time_allowance - entry['budget'], self._cancel_event,
+                                      poll=self._reporter.poll)
+
+        results = solver_method(*arguments.args, **arguments.kwargs)
+        if results and results.get('soln') is not None and not self._cancel_event.is_set():
+            cache.put(key, results, time_allowance, complete=bool(results.get('converged')))
+        if results and warm:
+            results['cached'] = 'warm'
+        return results
+
+    # Index array of a starting tour given as a TSPSolution or as a sequence of city indices
+    def _initialOrder(self, initial):
+        if isinstance(initial, TSPSolution):
+            initial = [city._index for city in initial.route]
+        order = np.asarray(initial, dtype=np.int64)
+        ncities = len(self._scenario.getCities())
+        if order.shape != (ncities,) or len(np.unique(order)) != ncities or order.min(initial=0) < 0 \
+                or order.max(initial=0) >= ncities:
+            raise ValueError('initial tour must visit each of the %d cities exactly once' % ncities)
+        return order
+
+    # The tour to start from: initial if given, else the tour a saved state stopped at (None for neither)
+    def _resumeOrder(self, initial, state):
+        if initial is None and state is not None:
+            initial = state['order']
+        return None if initial is None else self._initialOrder(initial)
+
+    # Candidate lists for local search, and on a dense scenario with missing edges the
+    # FeasibilityIndex test that lets it skip moves onto them (None otherwise)
+    def _searchLists(self, neighbors):
+        scenario = self._scenario
+        if scenario.isSparse() or not scenario.hasRemovedEdges():
+            return neighbor_lists(scenario.getCosts(), neighbors), None
+        feasibility = scenario.getFeasibility()
+        return feasibility.neighbor_lists(neighbors), feasibility.exists
+
+    # The dense cost matrix, for the solvers that keep n x n arrays of their own (pheromone,
+    # penalties); a sparse scenario has none, and building one could run out of memory
+    def _denseCosts(self, solver):
+        if self._scenario.isSparse():
+            raise ValueError('%s needs the dense cost matrix, which a sparse scenario does not have' % solver)
+        return self._scenario.getCostMatrix()
+
+    # A generator seeded with seed, or carrying on the random stream of a saved state
+    def _resumeRng(self, seed, state):
+        rng = np.random.default_rng(seed)
+        if state is not None and 'rng' in state:
+            rng.bit_generator.state = state['rng']
+        return rng
+
+    # Asks the running solver to stop; it returns its current BSSF as usual
+    def cancel(self):
+        self._cancel_event.set()
+
+    # Returns True (and cancels the solve) once the progress target is reached
+    def _reportSolution(self, soln, count=None):
+        if self._reporter.improved(soln, count):
+            self._cancel_event.set()
+            return True
+        return False
+
+    ''' <summary>
+		Generator interface to the anytime solvers: runs the named entry point on a
+		background thread and yields a dictionary for each improved BSSF as it is
+		found, followed by the solver's final results dictionary.  Closing the
+		generator early (e.g. breaking out of the loop) cancels the solve.
+		</summary>
+		<returns>dictionaries with at least 'cost', 'time', 'count' and 'soln'</returns>
+	'''
+    def iterSolutions(self, algorithm, time_allowance=60.0, min_interval=0.25, target_cost=None):
+        updates = queue.Queue()
+        outcome = {}
+        saved_reporter = self._reporter
+        self._reporter = ProgressReporter(updates.put, min_interval, target_cost)
+
+        def run():
+            try:
+                outcome['results'] = getattr(self, algorithm)(time_allowance=time_allowance)
+            except BaseException as error:
+                outcome['error'] = error
+            finally:
+                updates.put(None)
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        try:
+            update = updates.get()
+            while update is not None:
+                yield update
+                update = updates.get()
+            if 'error' in outcome:
+                raise outcome['error']
+            if outcome.get('results'):
+                yield outcome['results']
+        finally:
+            if worker.is_alive():
+                self.cancel()
+                worker.join()
+            self._reporter = saved_reporter
+
     ''' <summary>
 		This is the entry point for the default solver
 		which just finds a valid random tour.  Note this could be used to find your
@@ -32,6 +356,7 @@ class TSPSolver:
 		algorithm</returns> 
 	'''
 
+    @anytime
     def defaultRandomTour(self, time_allowance=60.0):
         results = {}
         cities = self._scenario.getCities()
@@ -39,8 +364,8 @@ class TSPSolver:
         foundTour = False
         count = 0
         best_solution = None
-        start_time = time.time()
-        while not foundTour and time.time() - start_time < time_allowance:
+        deadline = self._deadline
+        while not foundTour and not deadline.expired():
             # create a random permutation
             perm = np.random.permutation(ncities)
             route = []
@@ -52,14 +377,15 @@ class TSPSolver:
             if best_solution.cost < np.inf:
                 # Found a valid route
                 foundTour = True
-        end_time = time.time()
+                self._reportSolution(best_solution, count)
         results['cost'] = best_solution.cost if foundTour else math.inf
-        results['time'] = end_time - start_time
+        results['time'] = deadline.elapsed()
         results['count'] = count
         results['soln'] = best_solution
         results['max'] = None
         results['total'] = None
         results['pruned'] = None
+        results['converged'] = foundTour
         return results
 
     ''' <summary>
@@ -73,50 +399,136 @@ class TSPSolver:
 		solution found, and three null values for fields not used for this 
 		algorithm</returns> 
 	'''
-    # Time Complexity: O(n) * O(n) = O(n^2)
-    # Space Complexity: O(n) + O(n) + O(n) = O(3n) = O(n)
+    # Time Complexity: O(n) * O(n) = O(n^2), numpy doing the inner O(n)
+    # Space Complexity: O(n) + O(n) + O(n) = O(3n) = O(n) (plus the feasibility index)
+    @anytime
     def greedy(self, time_allowance=60.0):
         results = {}
         routeFound = False
-        route = []
-        listOfPossibleStartCities = self._scenario.getCities().copy()  # Space Complexity: O(n)
+        bssf = None
         cities = self._scenario.getCities()  # Space Complexity: O(n)
-        startCity = listOfPossibleStartCities.pop()  # Space Complexity: O(n)
+        ncities = len(cities)
+        if self._scenario.isSparse():
+            costs = self._scenario.getCosts()
+            feasibility = None
+        else:
+            # valid successors sorted by cost, so the nearest unvisited one is the first unvisited one
+            feasibility = self._scenario.getFeasibility()
+        listOfPossibleStartCities = list(range(ncities))  # Space Complexity: O(n)
+        startCity = listOfPossibleStartCities.pop()
         city = startCity
-        route.append(city)
-        start_time = time.time()
-        while routeFound is False and time.time() - start_time < time_allowance:  # Time Complexity: O(n)
-            lowestCost = math.inf
-            lowestCity = None
-            for neighbor in cities:  # Time Complexity: O(n)
-                if neighbor is city:
-                    continue
-                if city.costTo(neighbor) < lowestCost and (neighbor not in route):
-                    lowestCost = city.costTo(neighbor)
-                    lowestCity = neighbor
+        route = [city]
+        unvisited = np.ones(ncities, dtype=bool)  # Space Complexity: O(n)
+        unvisited[city] = False
+        deadline = self._deadline
+        while routeFound is False and not deadline.expired():  # Time Complexity: O(n)
+            if feasibility is not None:
+                successors = feasibility.successors(city)
+                options = successors[unvisited[successors]]  # Time Complexity: O(n)
+                lowestCity = int(options[0]) if len(options) else None
+            else:
+                row = np.where(unvisited, costs[city], math.inf)  # Time Complexity: O(n)
+                lowestCity = int(np.argmin(row)) if row.min() < self._scenario.INFEASIBLE_COST else None
             if lowestCity is None:  # check to see if can't continue
-                if city.costTo(startCity) < lowestCost:  # check to see if we're done
+                closes = feasibility.exists(city, startCity) if feasibility is not None \
+                    else costs[city, startCity] < self._scenario.INFEASIBLE_COST
+                if not unvisited.any() and closes:  # check to see if we're done
                     routeFound = True
-                    bssf = TSPSolution(route)
+                    bssf = TSPSolution([cities[i] for i in route])
+                    self._reportSolution(bssf, len(route))
+                elif not listOfPossibleStartCities:
+                    # nearest neighbor dead-ends from every start city: on a dense scenario, search
+                    # for any tour instead (a sparse one's feasibility index would hold ~n^2 edges)
+                    if feasibility is not None:
+                        bssf = self.feasibleTour(deadline.remaining())['soln']
+                        routeFound = bssf is not None
+                    route = bssf.route if routeFound else []
+                    break
                 else:
+                    unvisited[route] = True
                     route.clear()
                     startCity = listOfPossibleStartCities.pop()
                     city = startCity
-            # route.append(city)
+                    route.append(city)
+                    unvisited[city] = False
             else:  # We did find a lowestCity
                 route.append(lowestCity)
+                unvisited[lowestCity] = False
                 city = lowestCity
 
-        end_time = time.time()
         results['cost'] = bssf.cost if routeFound else math.inf
-        results['time'] = end_time - start_time
+        results['time'] = deadline.elapsed()
         results['count'] = len(route)
         results['soln'] = bssf
         results['max'] = None
         results['total'] = None
         results['pruned'] = None
+        results['converged'] = routeFound
+        return results
+
+    ''' <summary>
+		A tour on existing edges only, however thin the scenario: backtracking
+		depth-first search with forward checking over the FeasibilityIndex (see
+		TSPLocalSearch.feasible_tour).  Use it for a valid initial tour when
+		greedy and the random tours keep hitting missing edges, as they do once
+		HARD_MODE_FRACTION_TO_REMOVE is well above 0.20.  Dense scenarios only:
+		the index holds every existing edge, which a sparse scenario never stores.
+		</summary>
+		<returns>results dictionary: cost of the tour (inf if none was found),
+		time, number of backtracking steps, and the tour (None if none was
+		found)</returns>
+	'''
+    # Time Complexity: O(n^2) on all but adversarial graphs; exponential at worst
+    # Space Complexity: O(edges) for the feasibility index
+    @anytime
+    def feasibleTour(self, time_allowance=60.0):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        if self._scenario.isSparse():
+            raise ValueError('feasibleTour needs a dense scenario; a sparse one has no feasibility index')
+        order, undone = feasible_tour(self._scenario.getFeasibility(), deadline)
+        bssf = None
+        if order is not None:
+            bssf = TSPSolution([cities[i] for i in order])
+            self._reportSolution(bssf)
+        results = {'cost': bssf.cost if bssf is not None else math.inf, 'time': deadline.elapsed(),
+                   'count': undone, 'soln': bssf, 'max': None, 'total': None, 'pruned': None,
+                   'converged': bssf is not None}
         return results
 
+    ''' <summary>
+		Insertion constructors (see TSPLocalSearch.insertion_tour): rule is
+		'nearest', 'farthest' or 'cheapest' insertion, starting from city start.
+		Builds one tour in O(n^2) on the cost matrix; farthest and cheapest
+		insertion tend to be better 2-opt starting points than greedy on
+		clustered cities.  The nearestInsertion, farthestInsertion and
+		cheapestInsertion entry points are the same with the rule fixed.
+		</summary>
+		<returns>results dictionary: cost of the tour, time, 1 tour built, and the
+		tour</returns>
+	'''
+    # Time Complexity: O(n^2)
+    # Space Complexity: O(n) (plus the cost matrix)
+    @anytime
+    def insertion(self, time_allowance=60.0, rule='cheapest', start=0):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        order = insertion_tour(self._scenario.getCosts(), rule, start)
+        bssf = TSPSolution([cities[i] for i in order])
+        self._reportSolution(bssf, 1)
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': 1, 'soln': bssf,
+                   'max': None, 'total': None, 'pruned': None, 'converged': True}
+        return results
+
+    def nearestInsertion(self, time_allowance=60.0):
+        return self.insertion(time_allowance, rule='nearest')
+
+    def farthestInsertion(self, time_allowance=60.0):
+        return self.insertion(time_allowance, rule='farthest')
+
+    def cheapestInsertion(self, time_allowance=60.0):
+        return self.insertion(time_allowance, rule='cheapest')
+
     ''' <summary>
 		This is the entry point for the branch-and-bound algorithm that you will implement
 		</summary>
@@ -125,21 +537,109 @@ class TSPSolver:
 		not include the initial BSSF), the best solution found, and three more ints: 
 		max queue size, total number of states created, and number of pruned states.</returns> 
 	'''
+    # Time Complexity: O(n^2) per state expanded (reducing an n x n matrix), O(n!) states in the worst case
+    # Space Complexity: O(n^2) per state on the queue
+    @anytime
     def branchAndBound(self, time_allowance=60.0):
-        pass
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        ncities = len(cities)
+
+        # Initial BSSF from greedy, falling back to a random tour
+        bssf = self.greedy(time_allowance)['soln']
+        if bssf is None or bssf.cost == math.inf:
+            bssf = self.defaultRandomTour(time_allowance)['soln']
+        best_cost = bssf.cost if bssf is not None else math.inf
+
+        matrix = np.array([[a.costTo(b) for b in cities] for a in cities], dtype=float)  # Space Complexity: O(n^2)
+        everyone = np.arange(ncities)
+        bound = self._reduceMatrix(matrix, everyone, everyone)
+
+        count = 0
+        total = 1
+        pruned = 0
+        max_queue = 1
+        tie = itertools.count()
+        # Deeper states first, then lower bounds: finds complete tours quickly and keeps the queue small
+        state_queue = [(ncities - 1, bound, next(tie), matrix, [0])]
+        while state_queue and not deadline.expired():
+            _, bound, _, matrix, path = heapq.heappop(state_queue)
+            if bound >= best_cost:
+                pruned += 1
+                continue
+            current = path[-1]
+            unvisited = np.setdiff1d(everyone, path, assume_unique=True)
+            for city in unvisited:  # Time Complexity: O(n)
+                if deadline.expired():
+                    break
+                if matrix[current, city] == math.inf:
+                    continue
+                total += 1
+                child_path = path + [int(city)]
+                if len(child_path) == ncities:
+                    soln = TSPSolution([cities[i] for i in child_path])
+                    if soln.cost < best_cost:
+                        bssf, best_cost = soln, soln.cost
+                        count += 1
+                        self._reportSolution(bssf, count)
+                    else:
+                        pruned += 1
+                    continue
+                child = matrix.copy()  # Space Complexity: O(n^2)
+                child[current, :] = math.inf
+                child[:, city] = math.inf
+                child[city, 0] = math.inf
+                rows = np.append(np.setdiff1d(unvisited, [city], assume_unique=True), city)
+                cols = np.append(np.setdiff1d(unvisited, [city], assume_unique=True), 0)
+                child_bound = bound + matrix[current, city] + self._reduceMatrix(child, rows, cols)
+                if child_bound >= best_cost:
+                    pruned += 1
+                    continue
+                heapq.heappush(state_queue, (ncities - len(child_path), child_bound, next(tie), child, child_path))
+            max_queue = max(max_queue, len(state_queue))
+        pruned += sum(1 for state in state_queue if state[1] >= best_cost)
+
+        results = {'cost': best_cost, 'time': deadline.elapsed(), 'count': count, 'soln': bssf,
+                   'max': max_queue, 'total': total, 'pruned': pruned,
+                   'converged': not state_queue and not deadline.expired()}
+        return results
+
+    # Reduces the open rows, then the open columns, of matrix in place so each has a zero.
+    # Returns the total amount subtracted (a lower bound on the remaining cost), or inf when
+    # some city can no longer be left or entered.
+    # Time Complexity: O(n^2)
+    # Space Complexity: O(n)
+    def _reduceMatrix(self, matrix, rows, cols):
+        row_mins = matrix[rows].min(axis=1)
+        if np.isinf(row_mins).any():
+            return math.inf
+        matrix[rows] -= row_mins[:, None]
+        col_mins = matrix[:, cols].min(axis=0)
+        if np.isinf(col_mins).any():
+            return math.inf
+        matrix[:, cols] -= col_mins[None, :]
+        return row_mins.sum() + col_mins.sum()
 
     ''' <summary>
     	This is the entry point for the algorithm you'll write for your group project.
+    	2-opt from a greedy tour, or from initial (a TSPSolution or index array) if given.
+    	Passing the 'state' of an earlier result resumes its 2-opt sweep.
     	</summary>
     	<returns>results dictionary for GUI that contains three ints: cost of best solution, 
     	time spent to find best solution, total number of solutions found during search, the 
     	best solution found.  You may use the other three field however you like.
     	algorithm</returns> 
     '''
-    def fancy(self, time_allowance=60.0):
-        initial_greedy_sol = self.greedy()["soln"]
+    @anytime
+    def fancy(self, time_allowance=60.0, initial=None, state=None):
+        start = self._resumeOrder(initial, state)
+        if start is None:
+            initial_greedy_sol = self.greedy()["soln"]
+        else:
+            cities = self._scenario.getCities()
+            initial_greedy_sol = TSPSolution([cities[i] for i in start])
 
-        results = self.two_opt(initial_greedy_sol, time_allowance)
+        results = self.two_opt(initial_greedy_sol, time_allowance, state=state)
         # results = self.three_opt(initial_greedy_sol, time_allowance)
 
         print("cost: ", results["cost"])
@@ -147,24 +647,835 @@ class TSPSolver:
 
         return results
 
+    ''' <summary>
+		Parallel multi-start 2-opt.  Every worker process repeatedly runs a
+		neighbor-list 2-opt descent (see TSPLocalSearch) from a new start -- a greedy
+		tour from a different start city, a random permutation, or a double-bridge
+		perturbation of its own best tour -- until the time allowance runs out, and
+		the best tour over all workers is returned.  Each worker's best-so-far tours
+		are streamed back as they are found.  Every worker first descends from
+		initial if one is given; with the 'state' of an earlier result, each worker
+		instead picks up from the best tour it had then.  With merge, each worker
+		keeps its MULTISTART_OPTIMA best distinct local optima rather than only the
+		best, and the last MULTISTART_MERGE_SHARE of the time allowance merges all
+		of them by partition crossover (TSPLocalSearch.merge_tours) and polishes
+		the merged tour's new edges with local search.
+		</summary>
+		<returns>results dictionary: cost of best solution, time, total number of
+		descents (local optima found), the best solution, total number of improving
+		moves in 'total', the per-worker stats in 'workers', what merging saved
+		over the best local optimum in 'merge_gain', and the workers' best tours
+		in 'state'</returns>
+	'''
+    MULTISTART_OPTIMA = 4
+    MULTISTART_MERGE_SHARE = 0.1
+
+    # Time Complexity: O(time_allowance * workers) -- each descent is O(n k) per pass
+    # Space Complexity: O(n^2) per worker for the cost matrix
+    @anytime
+    def multiStart(self, time_allowance=60.0, workers=None, neighbors=10, initial=None, state=None, merge=True):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        workers = workers or os.cpu_count() or 1
+        keep = self.MULTISTART_OPTIMA if merge else 1
+        resumes = [self._resumeOrder(initial, None)] * workers
+        if initial is None and state is not None:
+            resumes = [self._initialOrder(state['tours'][w % len(state['tours'])]) for w in range(workers)]
+        # spawn rather than fork: the GUI solves on a QThread, and forking a threaded process is unsafe
+        context = multiprocessing.get_context('spawn')
+        cancel_event = context.Event()
+        improvements = context.Queue()
+        seeds = [int(seq.generate_state(1)[0]) for seq in np.random.SeedSequence().spawn(workers)]
+        end_time = time.monotonic() + deadline.remaining() * (1.0 - self.MULTISTART_MERGE_SHARE if merge else 1.0)
+
+        best = [math.inf, None]
+
+        def collect():
+            while True:
+                try:
+                    cost, order = improvements.get_nowait()
+                except queue.Empty:
+                    return
+                if cost < best[0]:
+                    best[:] = [cost, TSPSolution([cities[i] for i in order])]
+                    self._reportSolution(best[1])
+
+        with self._scenario.share() as shared:
+            pool = context.Pool(workers, initializer=_initSearchWorker,
+                                initargs=(shared.handle, cancel_event, improvements))
+            try:
+                pending = pool.starmap_async(_multiStartWorker,
+                                             [(w, workers, end_time, seeds[w], neighbors, resumes[w], keep)
+                                              for w in range(workers)])
+                while not pending.ready():
+                    pending.wait(0.05)
+                    if deadline.expired():
+                        cancel_event.set()
+                    collect()
+                worker_stats = pending.get()
+                pool.close()
+                pool.join()
+            finally:
+                pool.terminate()
+        collect()
+
+        winner = min(worker_stats, key=lambda stats: stats['cost'])
+        best_order, best_cost = winner['tour'], winner['cost']
+        optima = [order for stats in worker_stats for order in stats.pop('optima')]
+        if merge and len(optima) > 1 and not deadline.expired():
+            costs = self._scenario.getCosts()
+            merged, merged_cost = merge_tours(costs, optima, self._scenario.isSymmetric())
+            if merged_cost < best_cost - IMPROVEMENT_EPSILON:
+                tour = make_tour(costs, merged)
+                changed = np.flatnonzero(successors(merged) != successors(best_order))
+                candidates, exists = self._searchLists(neighbors)
+                local_search(tour, candidates, deadline, active=changed, exists=exists)
+                best_order, best_cost = tour.sequence(), tour.cost()
+        bssf = TSPSolution([cities[i] for i in best_order])
+        self._reportSolution(bssf)
+        descents = sum(stats['descents'] for stats in worker_stats)
+        moves = sum(stats['moves'] for stats in worker_stats)
+        saved = {'order': best_order, 'tours': [stats.pop('tour') for stats in worker_stats]}
+
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': descents, 'soln': bssf,
+                   'max': None, 'total': moves, 'pruned': None, 'converged': False, 'descents': descents, 'moves': moves,
+                   'workers': worker_stats, 'merge_gain': winner['cost'] - best_cost, 'state': saved}
+        return results
+
+    ''' <summary>
+		Simulated annealing over random 2-opt, or-opt and swap moves, each evaluated
+		as an O(1) cost delta (see TSPLocalSearch.sample_move).  The starting
+		temperature is calibrated so that an average uphill move is accepted with
+		probability initial_acceptance; the temperature then drops once per epoch of
+		epoch_length moves, either geometrically (T *= cooling_rate) or following
+		Lundy-Mees (T /= 1 + beta T).  By default epochs are sized from the measured
+		move rate so that the schedule cools by a factor of 1000 over the time
+		allowance.  Once it has cooled below SA_FROZEN_FRACTION of the starting
+		temperature, reheat_after epochs without a new best tour reheat it to
+		reheat_fraction of the starting temperature.  Runs until
+		the time allowance is used up, reporting each new best tour.  Only looks up
+		single edges, so it also runs on sparse scenarios (Scenario.getCosts()).
+		Starts from initial (a TSPSolution or index array) when one is given.  The
+		returned 'state' holds the current tour, the schedule and the random
+		generator; passed back as state, the anneal continues from there rather
+		than recalibrating and cooling again from the top.
+		</summary>
+		<returns>results dictionary: cost of best solution, time, number of times the
+		best tour improved, the best solution, moves evaluated in 'total', the
+		final 'temperature', and the search 'state'</returns>
+	'''
+    SA_FROZEN_FRACTION = 0.01
+
+    # Time Complexity: O(1) per move evaluated, O(n) per move accepted
+    # Space Complexity: O(n) (plus the cost matrix)
+    @anytime
+    def simulatedAnnealing(self, time_allowance=60.0, schedule='geometric', cooling_rate=0.95,
+                           epoch_length=None, initial_acceptance=0.1, reheat_after=10, reheat_fraction=0.1,
+                           seed=None, initial=None, state=None):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        costs = self._scenario.getCosts()
+        ncities = len(cities)
+        rng = self._resumeRng(seed, state)
+        if epoch_length is None and state is not None:
+            epoch_length = state['epoch_length']
+        size_epochs = epoch_length is None
+        if size_epochs:
+            epoch_length = 1000  # first epoch only, to measure the move rate
+            epochs = math.log(1e-3) / math.log(cooling_rate)
+
+        start = self._resumeOrder(initial, state)
+        tour = make_tour(costs, initial_tour(costs, rng.integers(ncities)) if start is None else start)
+        current = tour.cost()
+        best_order, best_cost = tour.sequence(), current
+        if state is not None:
+            saved_best = self._initialOrder(state['best_order'])
+            if tour_cost(costs, saved_best) < best_cost:
+                best_order, best_cost = saved_best, tour_cost(costs, saved_best)
+        self._reportSolution(TSPSolution([cities[i] for i in best_order]))
+
+        if state is None:
+            temperature = self._calibrateTemperature(tour, costs, rng, initial_acceptance)
+            start_temperature = temperature
+            stale_epochs = 0
+        else:
+            temperature, start_temperature = state['temperature'], state['start_temperature']
+            stale_epochs = state['stale_epochs']
+        beta = (1.0 - cooling_rate) / start_temperature
+        count = 0
+        evaluated = 0
+        accepted = 0
+        while ncities >= 5 and not deadline.expired():
+            reported_cost = best_cost
+            epoch_start = deadline.elapsed()
+            for _ in range(epoch_length):  # Time Complexity: O(epoch_length)
+                if deadline.expired():
+                    break
+                move = sample_move(tour, costs, rng)
+                if move is None:
+                    continue
+                evaluated += 1
+                delta, move = move
+                if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+                    continue
+                apply_move(tour, move)
+                accepted += 1
+                current += delta
+                if current < best_cost - IMPROVEMENT_EPSILON:
+                    best_order, best_cost = tour.sequence(), current
+                    count += 1
+
+            current = tour.cost()  # resynchronize against drift in the running total
+            if size_epochs:
+                moves_per_second = epoch_length / max(deadline.elapsed() - epoch_start, 1e-6)
+                epoch_length = max(100, int(moves_per_second * time_allowance / epochs))
+                size_epochs = False
+            if best_cost < reported_cost:
+                stale_epochs = 0
+                self._reportSolution(TSPSolution([cities[i] for i in best_order]), count)
+            elif temperature < self.SA_FROZEN_FRACTION * start_temperature:
+                stale_epochs += 1
+            if stale_epochs >= reheat_after:
+                temperature = reheat_fraction * start_temperature
+                stale_epochs = 0
+            elif schedule == 'lundy-mees':
+                temperature = temperature / (1.0 + beta * temperature)
+            else:
+                temperature *= cooling_rate
+
+        bssf = TSPSolution([cities[i] for i in best_order])
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': count, 'soln': bssf,
+                   'max': None, 'total': evaluated, 'pruned': None, 'converged': False,
+                   'accepted': accepted, 'temperature': temperature,
+                   'state': {'order': tour.sequence(), 'best_order': best_order, 'temperature': temperature,
+                             'start_temperature': start_temperature, 'epoch_length': epoch_length,
+                             'stale_epochs': stale_epochs, 'rng': rng.bit_generator.state}}
+        return results
+
+    # Picks T0 so that exp(-mean uphill delta / T0) == acceptance, from sampled moves
+    # Time Complexity: O(samples)
+    def _calibrateTemperature(self, tour, costs, rng, acceptance, samples=1000):
+        uphill = []
+        for _ in range(samples):
+            move = sample_move(tour, costs, rng)
+            # moves onto missing edges would swamp the average
+            if move is not None and 0 < move[0] < self._scenario.INFEASIBLE_COST / 2:
+                uphill.append(move[0])
+        if not uphill:
+            return 1.0
+        return -np.mean(uphill) / math.log(acceptance)
+
+    ''' <summary>
+		Iterated local search.  After a full 2-opt/or-opt descent from a greedy tour,
+		it repeatedly applies a double-bridge kick (two short neighboring paths swap
+		places) and re-optimizes only around the cities whose edges the kick
+		changed, using the don't-look-bit work queue of TSPLocalSearch.local_search
+		rather than a full sweep.  A kick that leaves the tour no worse is kept;
+		otherwise its journaled reversals are undone.  Runs until the time allowance
+		is used up.  On a sparse scenario (Scenario.getCosts()) the candidate lists
+		come from a grid and the first tour from them, so memory stays O(n k).
+		Given initial (a TSPSolution or index array), descends from that instead.
+		Given the 'state' of an earlier result, it resumes from that tour with the
+		work queue its last descent was cut off with, instead of a full descent.
+		</summary>
+		<returns>results dictionary: cost of best solution, time, number of times the
+		best tour improved, the best solution, the number of kicks in 'total', the
+		number of kept kicks in 'accepted', and the search 'state'</returns>
+	'''
+    ILS_MAX_SEGMENT = 50
+
+    # Time Complexity: O(n k) for the first descent, then about O(k + n) per kick
+    # Space Complexity: O(n k)
+    @anytime
+    def iteratedLocalSearch(self, time_allowance=60.0, neighbors=10, seed=None, initial=None, state=None):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        costs = self._scenario.getCosts()
+        ncities = len(cities)
+        rng = self._resumeRng(seed, state)
+        candidates, exists = self._searchLists(neighbors)
+
+        start = self._resumeOrder(initial, state)
+        if start is None:
+            start = initial_tour(costs, rng.integers(ncities), candidates)
+        tour = make_tour(costs, start)
+        active = state['queue'] if state is not None and initial is None else None
+        _, _, pending = local_search(tour, candidates, deadline, active=active, exists=exists)
+        current = tour.cost()
+        best_order, best_cost = tour.sequence(), current
+        self._reportSolution(TSPSolution([cities[i] for i in best_order]))
+
+        count = 0
+        kicks = 0
+        accepted = 0
+        last_report = deadline.elapsed()
+        max_segment = min(self.ILS_MAX_SEGMENT, (ncities - 2) // 3)
+        while max_segment >= 1 and not deadline.expired():
+            # A [b0..b1] [c0..c1] D  ->  A [c0..c1] [b0..b1] D
+            a1 = rng.integers(ncities)
+            b0 = tour.next(a1)
+            b1 = advance(tour, b0, rng.integers(max_segment))
+            c0 = tour.next(b1)
+            c1 = advance(tour, c0, rng.integers(max_segment))
+            d0 = tour.next(c1)
+            kick = (costs[a1, c0] + costs[c1, b0] + costs[b1, d0]
+                    - costs[a1, b0] - costs[b1, c0] - costs[c1, d0])
+            tour.journal = []
+            move_segment(tour, c0, c1, a1)
+            kicks += 1
+            _, gain, queued = local_search(tour, candidates, deadline, active=[a1, b0, b1, c0, c1, d0],
+                                           exists=exists)
+            if kick + gain > IMPROVEMENT_EPSILON:
+                undo_journal(tour)
+                continue
+            tour.journal = None
+            pending = queued
+            accepted += 1
+            current += kick + gain
+            if current < best_cost - IMPROVEMENT_EPSILON:
+                # kicks are only kept when they do not make the tour worse, so the tour
+                # is always the best one so far and is only copied out when reported
+                current = tour.cost()  # resynchronize against drift in the running total
+                best_cost = current
+                count += 1
+                if deadline.elapsed() - last_report >= 0.1:
+                    last_report = deadline.elapsed()
+                    best_order = tour.sequence()
+                    self._reportSolution(TSPSolution([cities[i] for i in best_order]), count)
+
+        best_order = tour.sequence()
+        bssf = TSPSolution([cities[i] for i in best_order])
+        self._reportSolution(bssf, count)
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': count, 'soln': bssf,
+                   'max': None, 'total': kicks, 'pruned': None, 'converged': False, 'accepted': accepted,
+                   'state': {'order': best_order, 'queue': [int(city) for city in pending],
+                             'rng': rng.bit_generator.state}}
+        return results
+
+    ''' <summary>
+		Memetic genetic algorithm.  Individuals are index arrays and the whole
+		population's fitness is one vectorized lookup in the cost matrix.  Each
+		generation, parents are picked by binary tournament and recombined with
+		order crossover ('order'), directed edge recombination ('edge', which
+		avoids missing edges) or partition crossover ('partition', which keeps
+		the shared edges and the cheaper parent's paths elsewhere).  With probability mutation_rate a child then gets a
+		double-bridge kick.  Every child goes through a short 2-opt descent, started
+		only from the cities whose edges neither parent had.  Parents and children
+		compete for the next generation (duplicates dropped).  With workers > 1 the
+		descents -- by far the bulk of the work -- run in a process pool attached
+		to the shared scenario.  A descended copy of initial, if given, joins the
+		first population; the 'state' of an earlier result brings back its whole
+		population in place of the greedy one.  With merge, the final population
+		is merged into one tour by partition crossover (TSPLocalSearch.merge_tours).
+		</summary>
+		<returns>results dictionary: cost of best solution, time, number of times the
+		best tour improved, the best solution, population size in 'max', the
+		number of generations in 'total', and the search 'state'</returns>
+	'''
+    # Time Complexity: O(P (n + descent)) per generation
+    # Space Complexity: O(P n)
+    @anytime
+    def geneticAlgorithm(self, time_allowance=60.0, population=20, crossover='order', mutation_rate=0.3,
+                         workers=1, neighbors=10, seed=None, initial=None, state=None, merge=True):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        costs = self._scenario.getCosts()
+        ncities = len(cities)
+        rng = self._resumeRng(seed, state)
+        symmetric = self._scenario.isSymmetric()
+
+        with contextlib.ExitStack() as cleanup:
+            if workers > 1:
+                context = multiprocessing.get_context('spawn')
+                cancel_event = context.Event()
+                shared = cleanup.enter_context(self._scenario.share())
+                pool = cleanup.enter_context(context.Pool(
+                    workers, initializer=_initSearchWorker, initargs=(shared.handle, cancel_event, None)))
+                improve = lambda tours, actives: _improveInPool(pool, workers, tours, actives, deadline,
+                                                                cancel_event, neighbors)
+            else:
+                candidates, exists = self._searchLists(neighbors)
+                improve = lambda tours, actives: _improveTours(costs, candidates, tours, actives, deadline, exists)
+
+            # Initial population: greedy tours from different start cities, each fully descended
+            if state is None:
+                starts = rng.permutation(ncities)[:population]
+                pool_tours, pool_costs = improve([nearest_neighbor_tour(costs, start) for start in starts],
+                                                 [None] * len(starts))
+            else:
+                pool_tours = np.array([self._initialOrder(order) for order in state['population']])
+                pool_costs = population_costs(costs, pool_tours)
+            if initial is not None:
+                seeded, seeded_costs = improve([self._initialOrder(initial)], [None])
+                pool_tours = np.concatenate((seeded, pool_tours))
+                pool_costs = np.concatenate((seeded_costs, pool_costs))
+            best = int(np.argmin(pool_costs))
+            best_order, best_cost = pool_tours[best].copy(), pool_costs[best]
+            self._reportSolution(TSPSolution([cities[i] for i in best_order]))
+
+            count = 0
+            generations = 0
+            while len(pool_tours) > 1 and ncities >= 8 and not deadline.expired():
+                size = len(pool_tours)
+                # Binary tournaments, vectorized over the whole generation
+                draws = rng.integers(size, size=(size, 2, 2))
+                parents = np.where(pool_costs[draws[..., 0]] <= pool_costs[draws[..., 1]],
+                                   draws[..., 0], draws[..., 1])
+                children = []
+                actives = []
+                for first, second in parents:
+                    p1, p2 = pool_tours[first], pool_tours[second]
+                    if crossover == 'edge':
+                        child = edge_recombination(costs, p1, p2, rng, self._scenario.INFEASIBLE_COST)
+                    elif crossover == 'partition':
+                        child, _ = partition_crossover(costs, p1, p2, symmetric)
+                    else:
+                        child = order_crossover(p1, p2, rng)
+                    if rng.random() < mutation_rate:
+                        child = double_bridge(child, rng)
+                    succ = successors(child)
+                    broken = np.flatnonzero((succ != successors(p1)) & (succ != successors(p2)))
+                    children.append(child)
+                    actives.append(np.union1d(broken, succ[broken]))
+                child_tours, child_costs = improve(children, actives)
+                generations += 1
+
+                # (mu + lambda) replacement without duplicate tours
+                merged = np.concatenate((pool_tours, child_tours))
+                merged_costs = np.concatenate((pool_costs, child_costs))
+                keep, seen = [], set()
+                for index in np.argsort(merged_costs, kind='stable'):
+                    key = tour_key(merged[index], symmetric)
+                    if key not in seen:
+                        seen.add(key)
+                        keep.append(index)
+                        if len(keep) == population:
+                            break
+                pool_tours, pool_costs = merged[keep], merged_costs[keep]
+                if pool_costs[0] < best_cost - IMPROVEMENT_EPSILON:
+                    best_order, best_cost = pool_tours[0].copy(), pool_costs[0]
+                    count += 1
+                    self._reportSolution(TSPSolution([cities[i] for i in best_order]), count)
+
+            if merge and len(pool_tours) > 1:
+                merged, merged_cost = merge_tours(costs, pool_tours, symmetric)
+                if merged_cost < best_cost - IMPROVEMENT_EPSILON:
+                    best_order, best_cost = merged, merged_cost
+                    count += 1
+                    self._reportSolution(TSPSolution([cities[i] for i in best_order]), count)
+
+        bssf = TSPSolution([cities[i] for i in best_order])
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': count, 'soln': bssf,
+                   'max': population, 'total': generations, 'pruned': None, 'converged': False, 'generations': generations,
+                   'state': {'order': best_order, 'population': pool_tours, 'rng': rng.bit_generator.state}}
+        return results
+
+    ''' <summary>
+		MAX-MIN Ant System.  Pheromone (tau) and heuristic (eta = 1/cost) are n x n
+		arrays, and eta is zero on every edge missing from Scenario._edge_exists, so
+		ants never choose a missing edge while any real one is left and Hard
+		scenarios need no special handling.  All ants build their tours together:
+		each step is one vectorized roulette-wheel draw per ant over its current
+		city's candidate list (unvisited candidates only), falling back to the best
+		unvisited city by tau^alpha eta^beta when the list is used up.  The
+		iteration-best tour (optionally improved by local search) then deposits
+		pheromone after whole-matrix evaporation, tau is clamped to
+		[tau_min, tau_max], and the pheromone is reset after restart_after
+		iterations without a new best tour.  Each new best tour is reported.  The
+		first best tour is initial (a TSPSolution or index array) when given, and
+		the 'state' of an earlier result brings back its pheromone trails.
+		</summary>
+		<returns>results dictionary: cost of best solution, time, number of times the
+		best tour improved, the best solution, number of ants in 'max', the
+		number of iterations in 'total', and the search 'state'</returns>
+	'''
+    # Time Complexity: O(n^2 + m n k) per iteration for m ants
+    # Space Complexity: O(n^2)
+    @anytime
+    def antColony(self, time_allowance=60.0, ants=25, alpha=1.0, beta=2.0, rho=0.02, candidates=15,
+                  p_best=0.05, restart_after=100, improve=True, seed=None, initial=None, state=None):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        costs = self._denseCosts('antColony')
+        ncities = len(cities)
+        rng = self._resumeRng(seed, state)
+        ants = min(ants, ncities)
+
+        eta = np.where(self._scenario._edge_exists, 1.0 / np.maximum(costs, 1.0), 0.0)  # Space Complexity: O(n^2)
+        heuristic = eta ** beta
+        neighbors = neighbor_lists(costs, candidates)
+        candidate_list = np.array(neighbors[0])
+        ant_rows = np.arange(ants)
+
+        best_order = self._resumeOrder(initial, state)
+        if best_order is None:
+            best_order = nearest_neighbor_tour(costs, 0)
+        best_cost = tour_cost(costs, best_order)
+        self._reportSolution(TSPSolution([cities[i] for i in best_order]))
+
+        def pheromone_limits():
+            tau_max = 1.0 / (rho * best_cost)
+            root = p_best ** (1.0 / ncities)
+            tau_min = tau_max * (1.0 - root) / (max(ncities / 2.0 - 1.0, 1.0) * root)
+            return min(tau_min, tau_max), tau_max
+
+        tau_min, tau_max = pheromone_limits()
+        if state is None:
+            tau = np.full((ncities, ncities), tau_max)
+            stale = 0
+        else:
+            tau = np.array(state['pheromone'], dtype=float)
+            stale = state['stale']
+
+        count = 0
+        iterations = 0
+        while ncities >= 3 and not deadline.expired():
+            choice = tau ** alpha * heuristic  # Time Complexity: O(n^2)
+            tours = np.empty((ants, ncities), dtype=np.int64)
+            visited = np.zeros((ants, ncities), dtype=bool)
+            tours[:, 0] = rng.integers(ncities, size=ants)
+            visited[ant_rows, tours[:, 0]] = True
+            for step in range(1, ncities):  # Time Complexity: O(n)
+                current = tours[:, step - 1]
+                options = candidate_list[current]  # m x k
+                weights = choice[current[:, None], options]
+                weights[visited[ant_rows[:, None], options]] = 0.0
+                totals = weights.sum(axis=1)
+                # Roulette wheel on the candidate list
+                wheel = np.cumsum(weights, axis=1)
+                spins = rng.random(ants) * totals
+                picked = options[ant_rows, np.minimum((wheel < spins[:, None]).sum(axis=1), options.shape[1] - 1)]
+                # Candidate list used up: best unvisited city, or the cheapest if no real edge is left
+                stuck = np.flatnonzero(totals <= 0.0)
+                if len(stuck):
+                    fallback = np.where(visited[stuck], -1.0, choice[current[stuck]])
+                    best_next = np.argmax(fallback, axis=1)
+                    dead_end = fallback[np.arange(len(stuck)), best_next] <= 0.0
+                    if dead_end.any():
+                        forced = np.where(visited[stuck[dead_end]], np.inf, costs[current[stuck[dead_end]]])
+                        best_next[dead_end] = np.argmin(forced, axis=1)
+                    picked[stuck] = best_next
+                tours[:, step] = picked
+                visited[ant_rows, picked] = True
+                if deadline.expired():
+                    break
+            if deadline.expired():
+                break
+            iterations += 1
+
+            tour_costs = population_costs(costs, tours)
+            iteration_best = tours[np.argmin(tour_costs)]
+            if improve:
+                tour = make_tour(costs, iteration_best)
+                local_search(tour, neighbors, deadline)
+                iteration_best = tour.sequence()
+            iteration_cost = tour_cost(costs, iteration_best)
+            if iteration_cost < best_cost - IMPROVEMENT_EPSILON:
+                best_order, best_cost = iteration_best, iteration_cost
+                count += 1
+                stale = 0
+                tau_min, tau_max = pheromone_limits()
+                self._reportSolution(TSPSolution([cities[i] for i in best_order]), count)
+            else:
+                stale += 1
+
+            # Evaporate everywhere, deposit on the iteration-best tour, clamp
+            tau *= 1.0 - rho
+            tau[iteration_best, np.roll(iteration_best, -1)] += 1.0 / iteration_cost
+            np.clip(tau, tau_min, tau_max, out=tau)
+            if stale >= restart_after:
+                tau.fill(tau_max)
+                stale = 0
+
+        bssf = TSPSolution([cities[i] for i in best_order])
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': count, 'soln': bssf,
+                   'max': ants, 'total': iterations, 'pruned': None, 'converged': False,
+                   'state': {'order': best_order, 'pheromone': tau, 'stale': stale, 'rng': rng.bit_generator.state}}
+        return results
+
+    ''' <summary>
+		Guided local search.  Keeps a penalty count for every edge and runs the
+		don't-look-bit 2-opt/or-opt local search on the augmented cost
+		cost + lambda * penalty, where lambda is lambda_factor times the average edge
+		cost of the first local optimum.  Moves are still delta-evaluated; only the
+		matrix they read from changes.  At each local optimum, the tour edges with
+		the highest utility cost / (1 + penalty) are penalized, and the search
+		resumes from just their endpoints.  On symmetric scenarios an edge is
+		penalized in both directions, since a 2-opt reversal would otherwise
+		escape the penalty by running the same edge the other way.  The best tour
+		under the true cost is tracked throughout and returned when the time
+		allowance is used up.  The first tour is initial (a TSPSolution or index
+		array) when one is given.
+		The returned 'state' keeps the current tour, the edge penalties and the
+		pending work queue, so passing it back continues the same search.
+		</summary>
+		<returns>results dictionary: cost of best solution, time, number of times the
+		best tour improved, the best solution, the number of penalty rounds in
+		'total', and the search 'state'</returns>
+	'''
+    # Time Complexity: O(n) per penalty round plus the local search it triggers
+    # Space Complexity: O(n^2) for the penalties and the augmented costs
+    @anytime
+    def guidedLocalSearch(self, time_allowance=60.0, lambda_factor=0.3, neighbors=10, seed=None, initial=None,
+                          state=None):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        costs = self._denseCosts('guidedLocalSearch')
+        ncities = len(cities)
+        rng = self._resumeRng(seed, state)
+        candidates, exists = self._searchLists(neighbors)
+        real_edge = costs < self._scenario.INFEASIBLE_COST / 2
+        symmetric = self._scenario.isSymmetric()
+
+        augmented = costs.copy()  # Space Complexity: O(n^2)
+        penalties = np.zeros(costs.shape, dtype=np.int32)
+        start = self._resumeOrder(initial, state)
+        if start is None:
+            start = nearest_neighbor_tour(costs, rng.integers(ncities))
+        if state is not None:
+            src, dst, counts = state['penalties']
+            penalties[src, dst] = counts
+            augmented += state['penalty_weight'] * penalties
+        tour = make_tour(augmented, start)
+        active = state['queue'] if state is not None and initial is None else None
+        _, _, pending = local_search(tour, candidates, deadline, active=active, exists=exists)
+        best_order = tour.sequence()
+        best_cost = tour_cost(costs, best_order)
+        if state is not None and tour_cost(costs, state['best_order']) < best_cost:
+            best_order = self._initialOrder(state['best_order'])
+            best_cost = tour_cost(costs, best_order)
+        self._reportSolution(TSPSolution([cities[i] for i in best_order]))
+        if state is None:
+            penalty_weight = lambda_factor * best_cost / max(ncities, 1)
+        else:
+            penalty_weight = state['penalty_weight']
+
+        count = 0
+        rounds = 0
+        while ncities >= 5 and not deadline.expired():
+            # Penalize the maximum-utility edges of this local optimum (missing edges are
+            # already priced out by INFEASIBLE_COST, so they are left alone)
+            order = tour.sequence()
+            succ = np.roll(order, -1)
+            utility = np.where(real_edge[order, succ], costs[order, succ] / (1.0 + penalties[order, succ]), -1.0)
+            worst = np.flatnonzero(utility >= utility.max())
+            src, dst = order[worst], succ[worst]
+            if symmetric:
+                src, dst = np.concatenate((src, dst)), np.concatenate((dst, src))
+            penalties[src, dst] += 1
+            augmented[src, dst] += penalty_weight
+            tour.invalidate()
+            rounds += 1
+
+            _, _, pending = local_search(tour, candidates, deadline, active=np.concatenate((src, dst)),
+                                         exists=exists)
+            cost = tour_cost(costs, tour.sequence())
+            if cost < best_cost - IMPROVEMENT_EPSILON:
+                best_order, best_cost = tour.sequence(), cost
+                count += 1
+                self._reportSolution(TSPSolution([cities[i] for i in best_order]), count)
+
+        src, dst = np.nonzero(penalties)
+        bssf = TSPSolution([cities[i] for i in best_order])
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': count, 'soln': bssf,
+                   'max': None, 'total': rounds, 'pruned': None, 'converged': False,
+                   'state': {'order': tour.sequence(), 'best_order': best_order,
+                             'penalties': (src, dst, penalties[src, dst]), 'penalty_weight': penalty_weight,
+                             'queue': [int(city) for city in pending], 'rng': rng.bit_generator.state}}
+        return results
+
+    ''' <summary>
+		Local search finished off with exact window reordering: after a 2-opt /
+		or-opt descent, windows of window consecutive cities slide along the
+		tour and each is rearranged into its cheapest order between its two fixed
+		end cities by a bitmask DP (TSPLocalSearch.window_polish).  Reordered
+		windows restart the descent from their cities, and the two alternate
+		until neither finds anything or the time allowance runs out.  The cost is
+		predictable: O(n 2^k k^2) per sweep for windows of k cities, so window
+		should stay around 8 to 12.  Starts from initial (a TSPSolution or index
+		array) when given; the 'state' of an earlier result resumes its tour and
+		window position.
+		</summary>
+		<returns>results dictionary: cost of the tour, time, number of windows
+		reordered, the tour, the window size in 'max', the number of improving
+		local search moves in 'total', and the search 'state'</returns>
+	'''
+    # Time Complexity: O(n 2^k k^2) per sweep plus the descents
+    # Space Complexity: O(n k + 2^k k) per batch of windows
+    @anytime
+    def windowPolish(self, time_allowance=60.0, window=10, neighbors=10, initial=None, state=None):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        costs = self._scenario.getCosts()
+        candidates, exists = self._searchLists(neighbors)
+        shift = state['shift'] if state is not None and initial is None else 0
+
+        start = self._resumeOrder(initial, state)
+        if start is None:
+            start = initial_tour(costs, 0, candidates)
+        tour = make_tour(costs, start)
+        moves, _, _ = local_search(tour, candidates, deadline, exists=exists)
+        order = tour.sequence()
+        self._reportSolution(TSPSolution([cities[i] for i in order]))
+
+        reordered = 0
+        converged = False
+        while not deadline.expired():
+            before = order.copy()
+            found, _, shift = window_polish(costs, order, window, deadline, shift=shift)
+            if not found:
+                converged = not deadline.expired()
+                break
+            reordered += found
+            self._reportSolution(TSPSolution([cities[i] for i in order]), reordered)
+            tour = make_tour(costs, order)
+            changed, _, _ = local_search(tour, candidates, deadline, active=order[order != before], exists=exists)
+            moves += changed
+            order = tour.sequence()
+            if not changed:
+                converged = not deadline.expired()
+                break
+
+        bssf = TSPSolution([cities[i] for i in order])
+        self._reportSolution(bssf, reordered)
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': reordered, 'soln': bssf,
+                   'max': window, 'total': moves, 'pruned': None, 'converged': converged,
+                   'state': {'order': order, 'shift': shift}}
+        return results
+
+    ''' <summary>
+		Divide and conquer for very large scenarios.  The cities are split into
+		clusters of at most cluster_size by k-d median cuts, and every cluster's
+		cycle is built (farthest insertion) and improved by the 2-opt/or-opt local
+		search on the cluster's own small cost matrix, in a pool of worker
+		processes.  The clusters are then taken in Hilbert-curve order of their
+		centroids, and each one's cycle is joined onto the tour so far by the
+		cheapest edge exchange between the cities of the two clusters that face
+		each other (TSPLocalSearch.join_cycles).  Finally a local search over the
+		whole scenario, started from just the boundary cities (those with a
+		candidate neighbor in another cluster), repairs the seams.  Nothing larger
+		than a cluster's matrix is built, so sparse scenarios work too.
+		</summary>
+		<returns>results dictionary: cost of the tour, time, the number of clusters
+		in 'count' and 'max', the tour, and the number of improving moves of the
+		boundary polish in 'total'</returns>
+	'''
+    # Share of the time allowance for solving the clusters; the rest is for the polish
+    DECOMPOSITION_SOLVE_SHARE = 0.6
+    # Cities per side tried when joining two neighboring clusters
+    DECOMPOSITION_JOIN_CANDIDATES = 40
+
+    # Time Complexity: O(n m) for clusters of m cities, plus the local searches
+    # Space Complexity: O(n k) plus O(m^2) per cluster being solved
+    @anytime
+    def decomposition(self, time_allowance=60.0, cluster_size=1000, workers=None, neighbors=10):
+        deadline = self._deadline
+        cities = self._scenario.getCities()
+        costs = self._scenario.getCosts()
+        ncities = len(cities)
+        workers = workers or os.cpu_count() or 1
+        xs, ys, _ = self._scenario.getCoordinates()
+
+        clusters = kd_partition(xs, ys, max(cluster_size, 2))
+        if len(clusters) > 1:
+            centroids = np.array([(xs[group].mean(), ys[group].mean()) for group in clusters])
+            clusters = [clusters[i] for i in hilbert_tour(centroids[:, 0], centroids[:, 1])]
+
+        # Every cluster's cycle, in local indices; at most two per worker in flight
+        solve_deadline = deadline.child(self.DECOMPOSITION_SOLVE_SHARE * deadline.remaining())
+        local_orders = [None] * len(clusters)
+        if workers > 1 and len(clusters) > 1:
+            end_time = time.monotonic() + solve_deadline.remaining()
+            context = multiprocessing.get_context('spawn')
+            cancel_event = context.Event()
+            with context.Pool(min(workers, len(clusters)), initializer=_initClusterWorker,
+                              initargs=(cancel_event,)) as pool:
+                pending = collections.deque()
+                submitted = 0
+                while submitted < len(clusters) or pending:
+                    while submitted < len(clusters) and len(pending) < 2 * workers:
+                        group = clusters[submitted]
+                        pending.append((submitted, pool.apply_async(
+                            _clusterWorker, (costs[group[:, None], group], end_time, neighbors))))
+                        submitted += 1
+                    index, answer = pending[0]
+                    answer.wait(0.05)
+                    if deadline.expired():
+                        cancel_event.set()
+                    if answer.ready():
+                        local_orders[index] = answer.get()
+                        pending.popleft()
+        else:
+            for index, group in enumerate(clusters):
+                local_orders[index] = _solveCluster(costs[group[:, None], group], solve_deadline, neighbors)
+
+        # Stitch the cycles together, each onto the one before it
+        succ = np.empty(ncities, dtype=np.int64)
+        for group, local in zip(clusters, local_orders):
+            order = group[local]
+            succ[order] = np.roll(order, -1)
+        count = self.DECOMPOSITION_JOIN_CANDIDATES
+        for previous, group in zip(clusters, clusters[1:]):
+            join_cycles(costs, succ, _facing(xs, ys, previous, group, count), _facing(xs, ys, group, previous, count))
+        order = np.empty(ncities, dtype=np.int64)
+        city = 0
+        for step in range(ncities):
+            order[step] = city
+            city = succ[city]
+        self._reportSolution(TSPSolution([cities[i] for i in order]))
+
+        # Polish along the seams
+        moves = 0
+        if len(clusters) > 1 and ncities >= 5:
+            candidates = neighbor_lists(costs, neighbors)
+            label = np.empty(ncities, dtype=np.int64)
+            for index, group in enumerate(clusters):
+                label[group] = index
+            out_nbrs = candidates[0]
+            owner = np.repeat(np.arange(ncities), [len(row) for row in out_nbrs])
+            flat = np.concatenate(out_nbrs)
+            boundary = np.unique(owner[label[flat] != label[owner]])
+            tour = make_tour(costs, order)
+            moves, _, _ = local_search(tour, candidates, deadline, active=boundary)
+            order = tour.sequence()
+
+        bssf = TSPSolution([cities[i] for i in order])
+        self._reportSolution(bssf)
+        results = {'cost': bssf.cost, 'time': deadline.elapsed(), 'count': len(clusters), 'soln': bssf,
+                   'max': len(clusters), 'total': moves, 'pruned': None, 'converged': False}
+        return results
+
+    # Row of the route a saved two_opt/three_opt state stopped its sweep on (1 to start afresh)
+    def _resumeRow(self, state, nroute):
+        if state is None or not 1 <= state.get('i', 1) < nroute - 2:
+            return 1
+        return state['i']
+
     # Time Complexity: O(c) * O(n) * O(n) = O(c* n^2) = O(n^2)
     # Space Complexity: O(n) + O(n) + O(n) = O(3n) = O(n)
-    def two_opt(self, soln, time_allowance):
+    @anytime
+    def two_opt(self, soln, time_allowance, state=None):
         sol_to_beat = soln  # Space: O(n)
         route_to_beat = sol_to_beat.route.copy()  # Space Complexity: O(n)
 
-        start_time = time.time()
+        deadline = self._deadline
         improved = True
         count = 0
         iter = 1
+        i = first = self._resumeRow(state, len(route_to_beat))
 
         # Time Complexity: O(c) (which is bounded to a small const by the efficiency of greedy - should be less than 5)
-        while improved and time.time() - start_time < time_allowance:
+        while improved and not deadline.expired():
             print("Iteration num: %s" % iter)
             iter += 1
             improved = False
-            for i in range(1, len(route_to_beat) - 2):  # Time Complexity: O(n)
+            # a resumed sweep starts at the row it was stopped on and wraps around
+            rows = list(range(first, len(route_to_beat) - 2)) + list(range(1, first))
+            first = 1
+            for i in rows:  # Time Complexity: O(n)
                 for j in range(i + 1, len(route_to_beat)):
+                    if deadline.expired():
+                        break
                     if j - i == 1:
                         continue
                     new_route = route_to_beat.copy()  # Space Complexity: O(n)
@@ -175,35 +1486,47 @@ class TSPSolver:
                         route_to_beat = new_route
                         count += 1
                         improved = True
-        end_time = time.time()
+                        if self._reportSolution(sol_to_beat, count):
+                            break
+                if deadline.expired():
+                    break
 
-        results = {'cost': sol_to_beat.cost, 'time': end_time - start_time, 'count': count, 'soln': sol_to_beat,
-                   'max': None, 'total': None, 'pruned': None}
+        results = {'cost': sol_to_beat.cost, 'time': deadline.elapsed(), 'count': count, 'soln': sol_to_beat,
+                   'max': None, 'total': None, 'pruned': None,
+                   'converged': not improved and not deadline.expired(),
+                   'state': {'order': [city._index for city in route_to_beat], 'i': i if deadline.expired() else 1}}
 
         return results
 
     # Time Complexity:  O(c) * O(n) * O(n) * O(n) = O(c * n^3) = O(n^3)
     # Space Complexity: O(n) + O(n) + O(n) = O(3n) = O(n)
-    def three_opt(self, soln, time_allowance):
+    @anytime
+    def three_opt(self, soln, time_allowance, state=None):
         sol_to_beat = soln  # Space Complexity: O(n)
         route_to_beat = sol_to_beat.route.copy()  # Space Complexity: O(n)
 
-        start_time = time.time()
+        deadline = self._deadline
         improved = True
         count = 0
         iter = 1
+        i = first = self._resumeRow(state, len(route_to_beat))
 
         # Time Complexity: O(c) (which is bounded to a small const by the efficiency of greedy - should be less than 5)
-        while improved and time.time() - start_time < time_allowance:
+        while improved and not deadline.expired():
             print("Iteration num: %s" % iter)
             iter += 1
             improved = False
-            for i in range(1, len(route_to_beat) - 2):  # Time Complexity: O(n)
+            # a resumed sweep starts at the row it was stopped on and wraps around
+            rows = list(range(first, len(route_to_beat) - 2)) + list(range(1, first))
+            first = 1
+            for i in rows:  # Time Complexity: O(n)
                 for j in range(i + 1, len(route_to_beat)):  # Time Complexity: O(n)
                     if j - i == 1:
                         continue
                     else:
                         for k in range(j + 1, len(route_to_beat)):  # Time Complexity: O(n)
+                            if deadline.expired():
+                                break
                             if k - j == 1:
                                 continue
                             # 6 cases
@@ -237,9 +1560,140 @@ class TSPSolver:
                                 route_to_beat = array[0].route
                                 improved = True
                                 count += 1
-        end_time = time.time()
+                                if self._reportSolution(sol_to_beat, count):
+                                    break
+                    if deadline.expired():
+                        break
+                if deadline.expired():
+                    break
 
-        results = {'cost': sol_to_beat.cost, 'time': end_time - start_time, 'count': count, 'soln': sol_to_beat,
-                   'max': None, 'total': None, 'pruned': None}
+        results = {'cost': sol_to_beat.cost, 'time': deadline.elapsed(), 'count': count, 'soln': sol_to_beat,
+                   'max': None, 'total': None, 'pruned': None,
+                   'converged': not improved and not deadline.expired(),
+                   'state': {'order': [city._index for city in route_to_beat], 'i': i if deadline.expired() else 1}}
 
         return results
+
+
+# Per-process state of the search pool workers, set up once by _initSearchWorker
+_search_worker = {}
+
+
+# Attaches to the scenario published with Scenario.share(), so nothing big is pickled
+def _initSearchWorker(handle, cancel_event, improvements):
+    scenario = Scenario.attach(handle)
+    _search_worker['scenario'] = scenario
+    _search_worker['costs'] = scenario.getCosts()
+    _search_worker['cancel'] = cancel_event
+    _search_worker['improvements'] = improvements
+
+
+# One multiStart worker: restarts descents until end_time (a time.monotonic() value;
+# the monotonic clock is system-wide, so it means the same thing in every process) and
+# returns its best tour, its keep best distinct local optima and its stats
+def _multiStartWorker(worker, nworkers, end_time, seed, neighbors, resume=None, keep=1):
+    costs = _search_worker['costs']
+    deadline = Deadline(end_time - time.monotonic(), _search_worker['cancel'])
+    rng = np.random.default_rng(seed)
+    ncities = costs.shape[0]
+    candidates = neighbor_lists(costs, neighbors)
+
+    best_order, best_cost = None, math.inf
+    optima = []  # (cost, order), cheapest first
+    stats = {'worker': worker, 'descents': 0, 'moves': 0, 'greedy': 0, 'random': 0, 'perturbed': 0, 'resumed': 0}
+    kinds = ('greedy', 'perturbed', 'random', 'perturbed')
+    attempt = 0
+    while best_order is None or not deadline.expired():
+        kind = kinds[attempt % len(kinds)] if best_order is not None else 'greedy'
+        if attempt == 0 and resume is not None:
+            kind, start = 'resumed', resume
+        elif kind == 'greedy':
+            start = nearest_neighbor_tour(costs, (worker + nworkers * stats['greedy']) % ncities)
+        elif kind == 'random':
+            start = rng.permutation(ncities)
+        else:
+            start = double_bridge(best_order, rng)
+        stats[kind] += 1
+        attempt += 1
+
+        tour = make_tour(costs, start)
+        moves, _, _ = two_opt_descent(tour, candidates, deadline)
+        stats['descents'] += 1
+        stats['moves'] += moves
+        cost = tour.cost()
+        if cost < best_cost:
+            best_order, best_cost = tour.sequence(), cost
+            _search_worker['improvements'].put((best_cost, best_order))
+        if all(cost != other for other, _ in optima) and (len(optima) < keep or cost < optima[-1][0]):
+            optima = sorted(optima + [(cost, tour.sequence())], key=lambda optimum: optimum[0])[:keep]
+
+    stats['tour'] = best_order
+    stats['optima'] = [order for _, order in optima]
+    stats['cost'] = best_cost
+    return stats
+
+
+# One cluster of decomposition(): a farthest insertion cycle on the cluster's own cost
+# matrix, improved by local search; returned in the cluster's local indices
+def _solveCluster(costs, deadline, neighbors):
+    order = insertion_tour(costs, 'farthest')
+    if len(order) >= 5:
+        tour = make_tour(costs, order)
+        local_search(tour, neighbor_lists(costs, neighbors), deadline)
+        order = tour.sequence()
+    return order
+
+
+def _initClusterWorker(cancel_event):
+    _search_worker['cancel'] = cancel_event
+
+
+def _clusterWorker(costs, end_time, neighbors):
+    return _solveCluster(costs, Deadline(end_time - time.monotonic(), _search_worker['cancel']), neighbors)
+
+
+# The count cities of group nearest the centroid of other, where a join between them belongs
+def _facing(xs, ys, group, other, count):
+    if len(group) <= count:
+        return group
+    distance = (xs[group] - xs[other].mean())**2 + (ys[group] - ys[other].mean())**2
+    return group[np.argpartition(distance, count)[:count]]
+
+
+# 2-opt (plus or-opt) descents of a batch of tours, each started from its active
+# cities (all of them for None); returns the improved tours as rows of an array and their costs
+def _improveTours(costs, candidates, tours, actives, deadline, exists=None):
+    improved = np.empty((len(tours), costs.shape[0]), dtype=np.int64)
+    for row, (order, active) in enumerate(zip(tours, actives)):
+        tour = make_tour(costs, order)
+        local_search(tour, candidates, deadline, active, exists)
+        improved[row] = tour.sequence()
+    return improved, population_costs(costs, improved)
+
+
+def _improveToursWorker(tours, actives, end_time, neighbors):
+    costs = _search_worker['costs']
+    if _search_worker.get('neighbors', (None,))[0] != neighbors:
+        _search_worker['neighbors'] = (neighbors, neighbor_lists(costs, neighbors))
+    deadline = Deadline(end_time - time.monotonic(), _search_worker['cancel'])
+    return _improveTours(costs, _search_worker['neighbors'][1], tours, actives, deadline)
+
+
+# Splits the batch evenly over the pool workers and stitches the answers back together;
+# passes a cancellation of the caller's deadline on to the workers
+def _improveInPool(pool, workers, tours, actives, deadline, cancel_event, neighbors):
+    end_time = time.monotonic() + deadline.remaining()
+    chunks = [(tours[w::workers], actives[w::workers], end_time, neighbors)
+              for w in range(workers) if tours[w::workers]]
+    pending = pool.starmap_async(_improveToursWorker, chunks)
+    while not pending.ready():
+        pending.wait(0.05)
+        if deadline.expired():
+            cancel_event.set()
+    answers = pending.get()
+    improved = np.empty((len(tours), answers[0][0].shape[1]), dtype=np.int64)
+    improved_costs = np.empty(len(tours))
+    for w, (chunk, chunk_costs) in enumerate(answers):
+        improved[w::workers] = chunk
+        improved_costs[w::workers] = chunk_costs
+    return improved, improved_costs